@@ -1,8 +1,12 @@
 import streamlit as st
 import os
-from io import BytesIO, StringIO
+import json
 import src.data_loader as loader
 import src.summarizer as processor
+import src.llm as llm_clients
+import src.metrics as metrics
+from src.cache import make_key
+from src.jobs import JobManager
 from dotenv import load_dotenv
 
 
@@ -206,11 +210,44 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
+# --- Shared LLM Client ---
+@st.cache_resource(show_spinner=False)
+def get_llm_client():
+    """Creates the process-wide LLM clients once and shares them across sessions."""
+    llm_clients.warm_up(ping=os.getenv("CRUXAI_WARMUP_PING") == "1")
+    return llm_clients.get_llm()
+
+get_llm_client()
+
+# --- Metrics ---
+@st.cache_resource(show_spinner=False)
+def start_metrics_server():
+    """Serves Prometheus metrics on CRUXAI_METRICS_PORT, once per process."""
+    if os.getenv("CRUXAI_METRICS_PORT"):
+        return metrics.serve_metrics()
+
+start_metrics_server()
+show_debug = st.sidebar.checkbox("Show debug panel", value=False)
+
+# --- Background Jobs ---
+@st.cache_resource(show_spinner=False)
+def get_job_manager():
+    """One bounded worker pool for summaries, shared by every session."""
+    return JobManager()
+
+job_manager = get_job_manager()
+
 # --- Session State Initialization ---
 if 'summary' not in st.session_state:
     st.session_state['summary'] = None
-if 'processing' not in st.session_state:
-    st.session_state['processing'] = False
+if 'job_id' not in st.session_state:
+    st.session_state['job_id'] = None
+if 'job_messages' not in st.session_state:
+    st.session_state['job_messages'] = []
+if 'summary_ttft' not in st.session_state:
+    st.session_state['summary_ttft'] = None
+if 'summary_trace' not in st.session_state:
+    st.session_state['summary_trace'] = None
 if 'generating' not in st.session_state:
     st.session_state['generating'] = False
 
@@ -225,7 +262,11 @@ st.header("Provide Your Content")
 tab1, tab2, tab3 = st.tabs(["📁 Upload File", "🔗 Blog URL", "✍️ Paste Text"])
 
 full_text = None
+# Uploads are spooled to disk and read while summarizing, so map calls start early
+# and the whole file never has to sit in memory as one string
+upload = None
 source_name = None
+document_id = None  # Set for pasted text that grows between submissions (append mode)
 
 with tab1:
     uploaded_file = st.file_uploader("Upload a .pdf or .txt file", type=["pdf", "txt"])
@@ -233,33 +274,71 @@ with tab1:
         source_name = uploaded_file.name
         with st.spinner("Loading..."):
             try:
-                if uploaded_file.type == "application/pdf":
-                    file_bytes = BytesIO(uploaded_file.getvalue())
-                    full_text = loader.load_pdf(file_bytes)
-                elif uploaded_file.type == "text/plain":
-                    stringio = StringIO(uploaded_file.getvalue().decode("utf-8"))
-                    full_text = loader.load_txt(stringio)
+                kind = "pdf" if uploaded_file.type == "application/pdf" else "txt"
+                upload = st.session_state.get('spooled_upload')
+                # Spool once per upload, not on every rerun of the script
+                if not upload or upload["file_id"] != uploaded_file.file_id or not os.path.exists(upload["path"]):
+                    path, digest = loader.spool_upload(uploaded_file, suffix=f".{kind}")
+                    upload = {"file_id": uploaded_file.file_id, "path": path, "digest": digest, "kind": kind}
+                    st.session_state['spooled_upload'] = upload
                 st.success("Content loaded successfully! 📥")
             except Exception as e:
                 st.error(f"Error loading content: {e}")
-                full_text = None
+                upload = None
+
+@st.cache_data(show_spinner=False, ttl=3600)
+def cached_load_urls(urls: tuple) -> list:
+    return loader.load_urls(list(urls))
 
 with tab2:
-    url = st.text_input("Enter the URL of a blog post")
-    if url:
-        source_name = url
-        with st.spinner("Loading..."):
-            try:
-                full_text = loader.load_blog_url(url)
-                st.success("Content loaded successfully! 🌐")
-            except Exception as e:
-                st.error(f"Error loading content: {e}")
-                full_text = None
+    url_mode = st.radio("Source", ["Single URL", "Bulk (URL list or sitemap)"], horizontal=True)
+    if url_mode == "Single URL":
+        url = st.text_input("Enter the URL of a blog post")
+        if url:
+            source_name = url
+            upload = None
+            with st.spinner("Loading..."):
+                try:
+                    page = loader.load_blog_page(url)
+                    full_text = page["text"]
+                    st.success("Content loaded successfully! 🌐")
+                    if page["removed_chars"]:
+                        st.caption(f"Stripped {page['removed_chars']:,} of {page['total_chars']:,} characters of page boilerplate.")
+                except Exception as e:
+                    st.error(f"Error loading content: {e}")
+                    full_text = None
+    else:
+        url_list = st.text_area("Enter one URL per line, or the URL of a sitemap.xml", height=150)
+        urls = [line.strip() for line in url_list.splitlines() if line.strip()]
+        if urls:
+            source_name = f"{len(urls)} URL(s)"
+            upload = None
+            with st.spinner("Fetching pages..."):
+                try:
+                    if len(urls) == 1 and urls[0].lower().endswith(".xml"):
+                        urls = loader.load_sitemap_urls(urls[0])
+                    results = cached_load_urls(tuple(urls))
+                    st.dataframe(
+                        [{"URL": r["url"], "Status": r["error"] or r["status"], "Latency (s)": round(r["latency"], 2),
+                          "Boilerplate removed (chars)": r["removed_chars"]} for r in results],
+                        use_container_width=True
+                    )
+                    texts = [f"Source: {r['url']}\n{r['text']}" for r in results if r["ok"] and r["text"]]
+                    full_text = "\n\n".join(texts) or None
+                    st.success(f"Loaded {len(texts)} of {len(results)} pages! 🌐")
+                except Exception as e:
+                    st.error(f"Error loading content: {e}")
+                    full_text = None
 
 with tab3:
     pasted_text = st.text_area("Paste your text here", height=300)
+    pasted_id = st.text_input("Document ID (optional)",
+                              help="For a growing document, e.g. a live transcript: re-submit it under the same ID "
+                                   "and only the new text is summarized.")
     if pasted_text:
         source_name = "Pasted Text"
+        upload = None
+        document_id = pasted_id.strip() or None
         with st.spinner("Loading..."):
             try:
                 full_text = pasted_text
@@ -269,33 +348,113 @@ with tab3:
                 full_text = None
 
 # --- Summarization Button & Logic ---
-@st.cache_data(show_spinner=False)
-def cached_summarize_document(full_text: str) -> str:
-    try:
-        result = processor.summarize_document(full_text)
-        if not result or not result.strip():
-            st.warning("Summary generation failed. Please try different content.")
-            return "No summary generated."
-        return result
-    except Exception as e:
-        st.error(f"Summary generation failed: {e}")
-        return f"Summary error occurred."
-
-if st.button("Summarize 📊", type="primary", disabled=(not full_text or st.session_state['processing'])):
-    if not full_text.strip() or len(full_text.strip()) < 50:
+def summarize_text_job(full_text: str, token_budget: int = None):
+    """Returns the job function summarizing 'full_text'; it receives the job's progress reporter."""
+    return lambda reporter: processor.summarize_document(full_text, token_budget=token_budget, on_progress=reporter)
+
+def read_upload(upload: dict):
+    """Yields a spooled upload's text in blocks: PDF pages, or cleaned blocks of a text file."""
+    if upload["kind"] == "pdf":
+        return loader.iter_pdf_text(upload["path"])
+    return loader.iter_text_blocks(upload["path"])
+
+def summarize_append_job(document_id: str, full_text: str):
+    """Returns the job function summarizing a new version of a growing document in append mode."""
+    return lambda reporter: processor.summarize_append(document_id, full_text, on_progress=reporter)
+
+def summarize_upload_job(upload: dict, token_budget: int = None):
+    """
+    Returns the job function extracting and summarizing a spooled upload block by
+    block. Budget mode ranks sentences across the whole document, so with a
+    'token_budget' the job extracts all of it first.
+    """
+    if token_budget:
+        return lambda reporter: processor.summarize_document(" ".join(read_upload(upload)), token_budget=token_budget,
+                                                             on_progress=reporter)
+    return lambda reporter: processor.summarize_stream(read_upload(upload), on_progress=reporter,
+                                                       source_id=f"{upload['kind']}:{upload['digest']}")
+
+# Budget mode: rank sentences locally and only send the best ones to the LLM
+budget_mode = st.checkbox("💰 Budget mode (send only the most important sentences to the AI)")
+token_budget = None
+if budget_mode:
+    token_budget = int(st.number_input("Token budget", min_value=1_000, value=50_000, step=5_000))
+
+current_job = job_manager.get(st.session_state['job_id']) if st.session_state['job_id'] else None
+job_running = current_job is not None and current_job.active
+
+if st.button("Summarize 📊", type="primary", disabled=((not full_text and not upload) or job_running)):
+    if upload:
+        # Identical uploads (from any session) share one job and its result
+        current_job = job_manager.submit(f"{upload['kind']}:{upload['digest']}:{token_budget}",
+                                         summarize_upload_job(upload, token_budget))
+    elif not full_text.strip() or len(full_text.strip()) < 50:
         st.error("Content is too short or invalid. Please provide at least 50 characters. 🚫")
+        current_job = None
+    elif document_id and not token_budget:
+        current_job = job_manager.submit(make_key("append", document_id, full_text),
+                                         summarize_append_job(document_id, full_text))
     else:
-        st.session_state['processing'] = True
-        with st.spinner("Generating Content..."):
-            try:
-                st.session_state['summary'] = cached_summarize_document(full_text)
-                if not st.session_state['summary'] or not st.session_state['summary'].strip():
-                    st.warning("Summary generation resulted in no valid content.")
-            except Exception as e:
-                st.error(f"Unexpected error: {e}")
-                st.session_state['summary'] = None
-            finally:
-                st.session_state['processing'] = False
+        current_job = job_manager.submit(make_key("text", processor.normalize_text(full_text), str(token_budget)),
+                                         summarize_text_job(full_text, token_budget))
+    if current_job is not None:
+        st.session_state['job_id'] = current_job.id
+        st.session_state['summary'] = None
+        st.session_state['summary_ttft'] = None
+        st.session_state['summary_trace'] = None
+        st.session_state['job_messages'] = []
+
+@st.fragment(run_every=0.5)
+def show_job_progress():
+    """Polls the session's job: progress while it runs, then hands the summary to the page."""
+    job = job_manager.get(st.session_state['job_id']) if st.session_state['job_id'] else None
+    if job is None:
+        st.session_state['job_id'] = None
+        return
+    state = job.snapshot()
+
+    if job.active:
+        if state["status"] == "queued":
+            st.progress(0.0, text="Waiting for a free worker...")
+        elif state["partial"]:
+            st.progress(1.0, text="Writing the final summary...")
+        elif state["stage"] == "reduce":
+            st.progress(1.0, text=f"Combining summaries (level {state['reduce_level']})...")
+        elif state["map_total"]:
+            st.progress(min(state["map_done"] / state["map_total"], 1.0),
+                        text=f"Summarizing chunks: {state['map_done']}/{state['map_total']}")
+        else:
+            st.progress(0.0, text="Preparing content...")
+        for level, message in state["messages"][-3:]:
+            getattr(st, level)(message)
+        if st.button("Cancel ✖️"):
+            job_manager.cancel(job.id)
+        if state["partial"]:
+            st.markdown(f"### Document Summary\n{state['partial']}")
+        return
+
+    # Finished: keep the warnings and errors, then redraw the page with the result
+    st.session_state['job_id'] = None
+    st.session_state['summary_trace'] = job.trace.to_dict() if job.trace else None
+    st.session_state['job_messages'] = [(level, message) for level, message in state["messages"] if level != "info"]
+    if state["status"] == "done":
+        result = state["result"]
+        if not result or not result.strip():
+            st.session_state['job_messages'].append(("warning", "Summary generation failed. Please try different content."))
+            result = "No summary generated."
+        st.session_state['summary'] = result
+        st.session_state['summary_ttft'] = state["ttft"]
+    elif state["status"] == "cancelled":
+        st.session_state['job_messages'].append(("info", "Summarization cancelled."))
+    else:
+        st.session_state['job_messages'].append(("error", f"Summary generation failed: {state['error']}"))
+    st.rerun()
+
+if st.session_state['job_id']:
+    show_job_progress()
+
+for level, message in st.session_state['job_messages']:
+    getattr(st, level)(message)
 
 # --- Display Section (Summary & Bonus Features) ---
 if st.session_state['summary'] is not None:
@@ -304,19 +463,22 @@ if st.session_state['summary'] is not None:
 
     if st.session_state['summary'] and st.session_state['summary'].strip():
         st.markdown(f"### Document Summary\n{st.session_state['summary']}")
+        if st.session_state['summary_ttft'] is not None:
+            st.caption(f"First words of the summary after {st.session_state['summary_ttft']:.1f}s.")
     else:
         st.error("Summary generation failed. Please try different content or check API limits. 🚨")
 
-    options = [
-        "🔑 Key Takeaways",
-        "🏷️ Topic & Keyword Extractor",
-        "📈 LinkedIn Post",
-        "🐦 Twitter Post"
-    ]
+    # Option label -> (artifact name, expander title, failure message)
+    extra_options = {
+        "🔑 Key Takeaways": ("takeaways", "Key Takeaways", "Takeaways generation failed. ⚠️"),
+        "🏷️ Topic & Keyword Extractor": ("keywords", "Topics & Keywords", "Keywords generation failed. ⚠️"),
+        "📈 LinkedIn Post": ("linkedin", "LinkedIn Post", "Post generation failed. ⚠️"),
+        "🐦 Twitter Post": ("twitter", "Twitter Post", "Twitter post generation failed. ⚠️"),
+    }
 
     selected_options = st.multiselect(
         "Select what to generate from the summary:",
-        options
+        list(extra_options)
     )
 
     if st.button("Generate Extra Content 🌟", disabled=not (st.session_state['summary'] and st.session_state['summary'].strip()) or st.session_state['generating']):
@@ -326,38 +488,60 @@ if st.session_state['summary'] is not None:
             st.session_state['generating'] = True
             with st.spinner("Generating Content..."):
                 try:
+                    # All selected artifacts start generating at once; each is shown as it streams in
+                    streams = processor.stream_extras(
+                        st.session_state['summary'],
+                        [extra_options[option][0] for option in selected_options]
+                    )
                     for option in selected_options:
-                        if option == "🔑 Key Takeaways":
-                            takeaways = processor.get_takeaways(st.session_state['summary'])
-                            with st.expander("Key Takeaways", expanded=True):
-                                if takeaways and takeaways.strip():
-                                    st.markdown(takeaways)
-                                else:
-                                    st.warning("Takeaways generation failed. ⚠️")
-                        elif option == "🏷️ Topic & Keyword Extractor":
-                            keywords = processor.get_keywords(st.session_state['summary'])
-                            with st.expander("Topics & Keywords", expanded=True):
-                                if keywords and keywords.strip():
-                                    st.markdown(keywords)
-                                else:
-                                    st.warning("Keywords generation failed. ⚠️")
-                        elif option == "📈 LinkedIn Post":
-                            post = processor.generate_social_post(st.session_state['summary'])
-                            with st.expander("LinkedIn Post", expanded=True):
-                                if post and post.strip():
-                                    st.markdown(post)
-                                else:
-                                    st.warning("Post generation failed. ⚠️")
-                        elif option == "🐦 Twitter Post":
-                            twitter_post = processor.generate_twitter_post(st.session_state['summary'])
-                            with st.expander("Twitter Post", expanded=True):
-                                if twitter_post and twitter_post.strip():
-                                    st.markdown(twitter_post)
-                                else:
-                                    st.warning("Twitter post generation failed. ⚠️")
+                        artifact, title, failure_message = extra_options[option]
+                        with st.expander(title, expanded=True):
+                            stream = streams[artifact]
+                            st.write_stream(stream)
+                            if not stream.text.strip():
+                                st.warning(failure_message)
+                            elif not stream.cached and stream.ttft is not None:
+                                st.caption(f"First token after {stream.ttft:.1f}s, complete after {stream.seconds:.1f}s.")
                 except Exception as e:
                     st.error(f"Generation error: {e}")
                 finally:
                     st.session_state['generating'] = False
 
-    st.markdown('</div>', unsafe_allow_html=True)
\ No newline at end of file
+    st.markdown('</div>', unsafe_allow_html=True)
+
+# --- Debug Panel ---
+if show_debug:
+    st.markdown("---")
+    st.subheader("Debug 🛠️")
+    trace = st.session_state['summary_trace']
+    if trace:
+        counters = trace["counters"]
+        col1, col2, col3, col4 = st.columns(4)
+        col1.metric("Total time", f"{trace['seconds']:.1f}s")
+        col2.metric("LLM calls", int(counters.get("llm_calls", 0)))
+        col3.metric("Tokens in / out", f"{int(counters.get('input_tokens', 0)):,} / {int(counters.get('output_tokens', 0)):,}")
+        col4.metric("Est. cost", f"${counters.get('cost_usd', 0):.4f}")
+        st.caption("Retries: {:.0f} map, {:.0f} client · 429s: {:.0f} · chunks: {:.0f} · cache hits: {:.0f}".format(
+            counters.get("map_retries", 0), counters.get("llm_client_retries", 0),
+            counters.get("map_throttled", 0) + counters.get("llm_client_throttled", 0),
+            counters.get("chunks", 0), counters.get("map_cache_hits", 0)))
+        st.dataframe(
+            [{"Stage": name, "Count": stage["count"], "Total (s)": round(stage["seconds"], 3),
+              "Max (s)": round(stage["max_seconds"], 3)} for name, stage in trace["stages"].items()],
+            use_container_width=True
+        )
+        st.dataframe(
+            [{"Stage / model": name, "Calls": use["calls"], "Seconds": round(use["seconds"], 2),
+              "Tokens in": use["input_tokens"], "Tokens out": use["output_tokens"], "Est. cost ($)": use["cost_usd"]}
+             for name, use in trace["models"].items()],
+            use_container_width=True
+        )
+        if counters.get("map_escalations"):
+            st.caption(f"{counters['map_escalations']:.0f} map chunk(s) escalated to the reduce model.")
+        with st.expander("Spans"):
+            st.dataframe(trace["spans"], use_container_width=True)
+        st.download_button("Download trace (JSON)", json.dumps(trace, indent=2), file_name=f"trace-{trace['id']}.json")
+    else:
+        st.info("Run a summary to see its trace.")
+    with st.expander("Prometheus metrics (this process)"):
+        st.code(metrics.render_prometheus(), language="text")
\ No newline at end of file
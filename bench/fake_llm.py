@@ -0,0 +1,140 @@
+import json
+import time
+import random
+import asyncio
+import logging
+import zlib
+import threading
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from google.api_core.exceptions import ResourceExhausted
+from src.chunking import count_tokens
+from src.packing import SECTION_PATTERN
+
+# Same logger the Gemini client's retries log to, so src.metrics counts fake retries too
+_retry_logger = logging.getLogger("langchain_google_genai.chat_models")
+_counter_lock = threading.Lock()
+
+
+class FakeChatModel(BaseChatModel):
+    """
+    Deterministic local stand-in for ChatGoogleGenerativeAI.
+
+    Each call takes 'latency' seconds plus the time to produce its output at
+    'tokens_per_second', answers with the first 'output_tokens' words of the
+    prompt (of each chunk, as a JSON object, for a packed prompt), and fails
+    with a 429 on a 'throttle_rate' fraction of attempts. A 'truncate_rate'
+    fraction of answers stop halfway with finish reason MAX_TOKENS, to exercise
+    map escalation and the recovery of cut-off packed answers.
+    Like the real client it retries 429s itself, up to 'max_retries' attempts
+    in total, 'retry_delay' seconds apart. Whether an attempt is throttled
+    depends only on the prompt, the attempt number and 'seed'.
+    """
+
+    model: str = "fake-gemini"
+    latency: float = 0.2
+    tokens_per_second: float = 200.0
+    output_tokens: int = 150
+    throttle_rate: float = 0.0
+    truncate_rate: float = 0.0
+    max_retries: int = 5
+    retry_delay: float = 0.05
+    seed: int = 0
+    calls: int = 0
+    attempts: int = 0
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat"
+
+    @property
+    def _identifying_params(self) -> dict:
+        return {"model": self.model}
+
+    def _get_ls_params(self, stop=None, **kwargs):
+        params = super()._get_ls_params(stop=stop, **kwargs)
+        params["ls_model_name"] = self.model
+        return params
+
+    def _prompt(self, messages) -> str:
+        return "\n".join(str(message.content) for message in messages)
+
+    def _answer(self, prompt: str) -> str:
+        sections = SECTION_PATTERN.findall(prompt)
+        if sections:
+            return json.dumps({chunk_id: " ".join(text.split()[:self.output_tokens])
+                               for chunk_id, _, text in sections})
+        return " ".join(prompt.split()[:self.output_tokens])
+
+    def _draw(self, prompt: str, salt: int) -> float:
+        return random.Random(zlib.crc32(prompt.encode("utf-8")) ^ (self.seed * 1_000_003 + salt)).random()
+
+    def _throttled(self, prompt: str, attempt: int) -> bool:
+        return self._draw(prompt, attempt) < self.throttle_rate
+
+    def _attempts(self, prompt: str):
+        """Yields the delay before each attempt; raises once the retries run out."""
+        self._count("calls")
+        for attempt in range(max(self.max_retries, 1)):
+            self._count("attempts")
+            if not self._throttled(prompt, attempt):
+                return
+            if attempt + 1 >= self.max_retries:
+                raise ResourceExhausted("429 RESOURCE_EXHAUSTED (fake)")
+            _retry_logger.warning(f"Retrying fake call in {self.retry_delay} seconds as it raised ResourceExhausted.")
+            yield self.retry_delay
+
+    def _count(self, field: str) -> None:
+        with _counter_lock:
+            setattr(self, field, getattr(self, field) + 1)
+
+    def _result(self, prompt: str) -> ChatResult:
+        text = self._answer(prompt)
+        finish_reason = "STOP"
+        if self._draw(prompt, -1) < self.truncate_rate:
+            text, finish_reason = text[:len(text) // 2], "MAX_TOKENS"
+        usage = {"input_tokens": count_tokens(prompt), "output_tokens": count_tokens(text),
+                 "total_tokens": count_tokens(prompt) + count_tokens(text)}
+        message = AIMessage(content=text, usage_metadata=usage, response_metadata={"finish_reason": finish_reason})
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _duration(self, text: str) -> float:
+        return self.latency + count_tokens(text) / self.tokens_per_second
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        prompt = self._prompt(messages)
+        for delay in self._attempts(prompt):
+            time.sleep(delay)
+        result = self._result(prompt)
+        time.sleep(self._duration(result.generations[0].text))
+        return result
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        prompt = self._prompt(messages)
+        for delay in self._attempts(prompt):
+            await asyncio.sleep(delay)
+        result = self._result(prompt)
+        await asyncio.sleep(self._duration(result.generations[0].text))
+        return result
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        prompt = self._prompt(messages)
+        for delay in self._attempts(prompt):
+            time.sleep(delay)
+        time.sleep(self.latency)
+        words = self._answer(prompt).split(" ")
+        for i, word in enumerate(words):
+            piece = word if i == 0 else " " + word
+            time.sleep(count_tokens(piece) / self.tokens_per_second)
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=piece))
+            if run_manager:
+                run_manager.on_llm_new_token(piece, chunk=chunk)
+            yield chunk
+
+
+def fake_factory(**settings):
+    """Returns a src.llm.set_llm_factory factory that builds FakeChatModels with these settings."""
+    def factory(model, temperature, max_retries):
+        return FakeChatModel(model=model, max_retries=max_retries, **settings)
+    return factory
@@ -0,0 +1,235 @@
+"""
+Offline benchmarks for the summarizer, with a local fake chat model in place of Gemini.
+
+    python -m bench.run                                   # quick matrix
+    python -m bench.run --preset full                     # 10 KB .. 100 MB, concurrency 1 .. 16
+    python -m bench.run --sizes 1MB --concurrency 4 --throttle-rate 0.05 --json results.json
+    python -m bench.run --baseline results.json           # fail on scenarios slower than a saved run
+    python -m bench.run --kinds summarize --map-mode packed --rpm 60   # several chunks per request
+
+Every scenario runs in a fresh process, so caches start cold and the reported
+peak memory (max RSS) belongs to that scenario alone. Results are printed and
+written to bench_output.txt.
+"""
+import os
+import re
+import sys
+import json
+import time
+import tempfile
+import argparse
+import multiprocessing
+
+PRESETS = {
+    "quick": {"sizes": ["10KB", "100KB", "1MB"], "concurrency": [2, 8]},
+    "full": {"sizes": ["10KB", "100KB", "1MB", "10MB", "100MB"], "concurrency": [1, 2, 4, 8, 16]},
+}
+KINDS = ("summarize", "pdf", "html", "txt", "extras")
+# Loaders and extras don't call the map step, so they only run once per size
+CONCURRENCY_KINDS = ("summarize",)
+EXTRAS_SUMMARY_BYTES = 8_000
+
+_UNITS = {"B": 1, "KB": 1024, "MB": 1024 ** 2, "GB": 1024 ** 3}
+
+
+def parse_size(value: str) -> int:
+    match = re.fullmatch(r"\s*(\d+(?:\.\d+)?)\s*([KMG]?B)?\s*", value.upper())
+    if not match:
+        raise argparse.ArgumentTypeError(f"Invalid size: {value}")
+    return int(float(match.group(1)) * _UNITS[match.group(2) or "B"])
+
+
+def _max_rss_mb():
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    # Linux reports kilobytes, macOS bytes
+    scale = 1 if sys.platform == "darwin" else 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale / 1024 ** 2
+
+
+def _run_scenario(scenario: dict, settings: dict, results) -> None:
+    """Runs one scenario in this (fresh) process and puts its result dict on 'results'."""
+    # The summarizer reads its limits at import time, so set them first
+    os.environ["CRUXAI_CACHE_DIR"] = tempfile.mkdtemp(prefix="cruxai-bench-")
+    os.environ["CRUXAI_RPM"] = str(settings["rpm"])
+    os.environ["CRUXAI_TPM"] = str(settings["tpm"])
+    os.environ["CRUXAI_MAX_CONCURRENCY"] = str(scenario["concurrency"] or 2)
+    os.environ["CRUXAI_MAX_CONCURRENCY_CEILING"] = str(max(scenario["concurrency"] or 2, 16))
+    if settings["map_mode"]:
+        os.environ["CRUXAI_MAP_MODE"] = settings["map_mode"]
+
+    from io import BytesIO, StringIO
+    import src.llm as llm
+    import src.metrics as metrics
+    import src.data_loader as loader
+    import src.summarizer as processor
+    from bench.fake_llm import fake_factory
+    from bench.synthetic import make_text, make_html, make_pdf
+
+    llm.set_llm_factory(fake_factory(**settings["fake"]))
+    kind, size = scenario["kind"], scenario["size"]
+
+    # Build the input before timing; it counts towards peak memory, reported separately
+    if kind == "extras":
+        text = make_text(EXTRAS_SUMMARY_BYTES, seed=settings["seed"])
+    else:
+        text = make_text(size, seed=settings["seed"])
+    payload = {"pdf": lambda: make_pdf(text), "html": lambda: make_html(text)}.get(kind, lambda: None)()
+    rss_before = _max_rss_mb()
+
+    started = time.perf_counter()
+    with metrics.trace("bench", **scenario) as trace:
+        if kind == "summarize":
+            output = processor.summarize_document(text, use_cache=False)
+        elif kind == "pdf":
+            output = loader.load_pdf(BytesIO(payload))
+        elif kind == "html":
+            output = loader.extract_main_content(payload)["text"]
+        elif kind == "txt":
+            output = loader.load_txt(StringIO(text))
+        else:
+            output = "\n".join(processor.generate_extras(text, list(processor.EXTRA_PROMPT_TEMPLATES)).values())
+    seconds = time.perf_counter() - started
+
+    counters = trace.summary()["counters"]
+    peak = _max_rss_mb()
+    results.put({
+        **scenario,
+        "seconds": round(seconds, 4),
+        "mb_per_second": round(size / 1024 ** 2 / seconds, 3) if seconds and kind != "extras" else None,
+        "llm_calls": int(counters.get("llm_calls", 0)),
+        "retries": int(counters.get("map_retries", 0) + counters.get("llm_client_retries", 0)),
+        "throttled": int(counters.get("map_throttled", 0) + counters.get("llm_client_throttled", 0)),
+        "input_tokens": int(counters.get("input_tokens", 0)),
+        "output_tokens": int(counters.get("output_tokens", 0)),
+        "chunks": int(counters.get("chunks", 0)),
+        "escalations": int(counters.get("map_escalations", 0)),
+        "models": trace.summary()["models"],
+        "peak_rss_mb": round(peak, 1) if peak is not None else None,
+        "rss_growth_mb": round(peak - rss_before, 1) if peak is not None else None,
+        "output_chars": len(output or ""),
+    })
+
+
+def run_scenario(scenario: dict, settings: dict) -> dict:
+    """Runs a scenario in a new process (spawned, so nothing is inherited) and returns its result."""
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    # A plain Process rather than a pool: PDF extraction starts worker processes of its own
+    process = context.Process(target=_run_scenario, args=(scenario, settings, results))
+    process.start()
+    try:
+        result = results.get(timeout=settings["timeout"])
+    except Exception:
+        process.terminate()
+        result = {**scenario, "error": "failed or timed out (see stderr)"}
+    process.join()
+    return result
+
+
+def build_scenarios(kinds: list, sizes: list, concurrency: list) -> list:
+    scenarios = []
+    for kind in kinds:
+        kind_sizes = [EXTRAS_SUMMARY_BYTES] if kind == "extras" else sizes
+        for size in kind_sizes:
+            for level in (concurrency if kind in CONCURRENCY_KINDS else [None]):
+                scenarios.append({"id": f"{kind}/{size}/{level or '-'}", "kind": kind, "size": size,
+                                  "concurrency": level})
+    return scenarios
+
+
+def format_row(result: dict) -> str:
+    if "error" in result:
+        return f"{result['id']:<28} ERROR: {result['error']}"
+    mbps = f"{result['mb_per_second']:.3f}" if result["mb_per_second"] is not None else "-"
+    rss = f"{result['peak_rss_mb']:.0f}" if result["peak_rss_mb"] is not None else "-"
+    return (f"{result['id']:<28} {result['seconds']:>9.2f} {mbps:>8} {result['llm_calls']:>6} "
+            f"{result['retries']:>7} {result['chunks']:>6} {rss:>9}")
+
+
+HEADER = f"{'scenario':<28} {'wall (s)':>9} {'MB/s':>8} {'calls':>6} {'retries':>7} {'chunks':>6} {'peak MB':>9}"
+
+
+def compare(results: list, baseline_path: str, tolerance: float) -> list:
+    """Returns a message for every scenario more than 'tolerance' slower than in the baseline."""
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = {result["id"]: result for result in json.load(f)["results"]}
+    regressions = []
+    for result in results:
+        before = baseline.get(result["id"])
+        if not before or "error" in before or "error" in result:
+            continue
+        if result["seconds"] > before["seconds"] * (1 + tolerance):
+            regressions.append(f"REGRESSION {result['id']}: {before['seconds']:.2f}s -> {result['seconds']:.2f}s")
+        if result["llm_calls"] > before["llm_calls"]:
+            regressions.append(f"REGRESSION {result['id']}: {before['llm_calls']} -> {result['llm_calls']} LLM calls")
+    return regressions
+
+
+def main(argv: list = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark CruxAi offline with a fake chat model.")
+    parser.add_argument("--preset", choices=list(PRESETS), default="quick")
+    parser.add_argument("--sizes", help="Comma-separated document sizes, e.g. 10KB,1MB,100MB (overrides the preset)")
+    parser.add_argument("--concurrency", help="Comma-separated initial map concurrency levels (overrides the preset)")
+    parser.add_argument("--kinds", default=",".join(KINDS), help=f"Comma-separated subset of {', '.join(KINDS)}")
+    parser.add_argument("--latency", type=float, default=0.2, help="Fake model seconds per call before output")
+    parser.add_argument("--tokens-per-second", type=float, default=200.0, help="Fake model output speed")
+    parser.add_argument("--output-tokens", type=int, default=150, help="Words in each fake response")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="Fraction of attempts that get a 429")
+    parser.add_argument("--truncate-rate", type=float, default=0.0,
+                        help="Fraction of answers cut short (MAX_TOKENS), which the map step escalates")
+    parser.add_argument("--retry-delay", type=float, default=0.05, help="Fake client's delay between its own retries")
+    parser.add_argument("--map-mode", choices=["async", "packed", "batch"],
+                        help="Map step to use (default: the summarizer's, which depends on --rpm)")
+    parser.add_argument("--rpm", type=float, default=1e6, help="Requests per minute for the map rate limiter")
+    parser.add_argument("--tpm", type=float, default=1e12, help="Tokens per minute for the map rate limiter")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--timeout", type=float, default=3600, help="Seconds before a scenario is abandoned")
+    parser.add_argument("--output", default="bench_output.txt", help="Text report")
+    parser.add_argument("--json", help="Also write the results as JSON (usable as a --baseline later)")
+    parser.add_argument("--baseline", help="JSON results of an earlier run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed slowdown against the baseline")
+    args = parser.parse_args(argv)
+
+    preset = PRESETS[args.preset]
+    sizes = [parse_size(size) for size in (args.sizes.split(",") if args.sizes else preset["sizes"])]
+    concurrency = [int(level) for level in args.concurrency.split(",")] if args.concurrency else preset["concurrency"]
+    kinds = [kind.strip() for kind in args.kinds.split(",")]
+    unknown = [kind for kind in kinds if kind not in KINDS]
+    if unknown:
+        parser.error(f"unknown kind(s): {', '.join(unknown)}")
+
+    settings = {
+        "rpm": args.rpm, "tpm": args.tpm, "seed": args.seed, "timeout": args.timeout, "map_mode": args.map_mode,
+        "fake": {"latency": args.latency, "tokens_per_second": args.tokens_per_second,
+                 "output_tokens": args.output_tokens, "throttle_rate": args.throttle_rate,
+                 "truncate_rate": args.truncate_rate,
+                 "retry_delay": args.retry_delay, "seed": args.seed},
+    }
+
+    lines = [f"CruxAi benchmark {time.strftime('%Y-%m-%d %H:%M:%S')}  settings: {json.dumps(settings)}", HEADER]
+    print("\n".join(lines), flush=True)
+    results = []
+    for scenario in build_scenarios(kinds, sizes, concurrency):
+        result = run_scenario(scenario, settings)
+        results.append(result)
+        lines.append(format_row(result))
+        print(lines[-1], flush=True)
+
+    regressions = compare(results, args.baseline, args.tolerance) if args.baseline else []
+    lines += regressions
+    for message in regressions:
+        print(message, file=sys.stderr)
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        f.write("\n".join(lines) + "\n")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"settings": settings, "results": results}, f, indent=2)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,94 @@
+import random
+
+# A small vocabulary keeps the text compressible and the token estimate realistic
+_WORDS = ("the data model system report result market growth team process value user "
+          "analysis performance risk quarter revenue cost product design research policy "
+          "network service customer strategy platform energy health security budget impact").split()
+
+# Repeated page furniture, so near-duplicate detection has something to find
+_BOILERPLATE = ("Confidential. This document is provided for information purposes only and does not "
+                "constitute an offer. All rights reserved. Page footer and legal notice repeated on every page.")
+
+
+def _sentence(rng: random.Random) -> str:
+    words = rng.choices(_WORDS, k=rng.randint(8, 24))
+    return " ".join(words).capitalize() + rng.choice([".", ".", ".", "?", "!"])
+
+
+def make_text(size_bytes: int, seed: int = 0, boilerplate_every: int = 20) -> str:
+    """
+    Returns about 'size_bytes' of English-like text in paragraphs, the same for
+    a given seed. Every 'boilerplate_every'-th paragraph is the same disclaimer.
+    """
+    rng = random.Random(seed)
+    paragraphs, size = [], 0
+    while size < size_bytes:
+        if boilerplate_every and len(paragraphs) % boilerplate_every == boilerplate_every - 1:
+            paragraph = _BOILERPLATE
+        else:
+            paragraph = " ".join(_sentence(rng) for _ in range(rng.randint(3, 8)))
+        paragraphs.append(paragraph)
+        size += len(paragraph) + 2
+    return "\n\n".join(paragraphs)[:size_bytes]
+
+
+def make_html(text: str) -> bytes:
+    """Wraps text in a blog-like page with navigation, sidebar and footer boilerplate."""
+    nav = "".join(f'<li><a href="/section/{i}">Section {i}</a></li>' for i in range(30))
+    body = "".join(f"<p>{paragraph}</p>" for paragraph in text.split("\n\n"))
+    return (f"<html><head><title>Bench</title><script>var x = 1;</script></head><body>"
+            f'<header><nav><ul>{nav}</ul></nav></header>'
+            f'<div class="sidebar">{nav}</div>'
+            f'<main><article><h1>Benchmark article</h1>{body}</article></main>'
+            f"<footer>{_BOILERPLATE}</footer></body></html>").encode("utf-8")
+
+
+def _pdf_escape(line: str) -> str:
+    return line.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def make_pdf(text: str, chars_per_page: int = 3000, chars_per_line: int = 90) -> bytes:
+    """
+    Builds a minimal PDF (Helvetica text, no dependencies) holding 'text', split
+    into pages of about 'chars_per_page' characters, that pypdf can extract.
+    """
+    words = text.split()
+    pages, page, line, page_chars = [], [], [], 0
+    for word in words:
+        line.append(word)
+        if sum(len(w) + 1 for w in line) >= chars_per_line:
+            page.append(" ".join(line))
+            page_chars += chars_per_line
+            line = []
+        if page_chars >= chars_per_page:
+            pages.append(page)
+            page, page_chars = [], 0
+    if line:
+        page.append(" ".join(line))
+    if page or not pages:
+        pages.append(page)
+
+    # Objects: 1 catalog, 2 page tree, 3 font, then a (page, content) pair per page
+    objects = [None, None, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    page_ids = []
+    for lines in pages:
+        content = "BT /F1 10 Tf 12 TL 40 800 Td " + " ".join(f"({_pdf_escape(l)}) Tj T*" for l in lines) + " ET"
+        content = content.encode("latin-1", "replace")
+        objects.append(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(content), content))
+        content_id = len(objects)
+        objects.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 842] "
+                       f"/Resources << /Font << /F1 3 0 R >> >> /Contents {content_id} 0 R >>".encode())
+        page_ids.append(len(objects))
+    objects[0] = b"<< /Type /Catalog /Pages 2 0 R >>"
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(f'{i} 0 R' for i in page_ids)}] /Count {len(page_ids)} >>".encode()
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n%s\nendobj\n" % (number, body)
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    out += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    return bytes(out)
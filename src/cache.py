@@ -0,0 +1,266 @@
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+from src.metrics import incr
+
+# Where on-disk caches live. Override with CRUXAI_CACHE_DIR.
+CACHE_DIR = os.getenv("CRUXAI_CACHE_DIR", ".cruxai_cache")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    key TEXT PRIMARY KEY,
+    value BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    accessed_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_accessed ON entries (accessed_at);
+CREATE INDEX IF NOT EXISTS idx_created ON entries (created_at);
+-- Running entry count and byte total, so eviction checks don't scan the table
+CREATE TABLE IF NOT EXISTS totals (id INTEGER PRIMARY KEY CHECK (id = 0), count INTEGER, bytes INTEGER);
+INSERT OR IGNORE INTO totals SELECT 0, COUNT(*), COALESCE(SUM(size), 0) FROM entries;
+CREATE TRIGGER IF NOT EXISTS totals_insert AFTER INSERT ON entries BEGIN
+    UPDATE totals SET count = count + 1, bytes = bytes + NEW.size;
+END;
+CREATE TRIGGER IF NOT EXISTS totals_delete AFTER DELETE ON entries BEGIN
+    UPDATE totals SET count = count - 1, bytes = bytes - OLD.size;
+END;
+"""
+
+_DELETE_OLDEST = "DELETE FROM entries WHERE key IN (SELECT key FROM entries ORDER BY accessed_at ASC LIMIT ?)"
+EVICT_BATCH = 256
+
+
+def make_key(*parts: str) -> str:
+    """Builds a content-addressed cache key from the given parts."""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\x1f")  # Separator so ("ab", "c") != ("a", "bc")
+    return digest.hexdigest()
+
+
+def _size_of(value) -> int:
+    return len(value.encode("utf-8")) if isinstance(value, str) else len(value)
+
+
+class SQLiteCache:
+    """
+    A small key/value store on top of SQLite with TTL and size-based eviction.
+    Values may be str or bytes; SQLite hands back whichever type was stored.
+    Safe to share between threads and between processes using the same file.
+    """
+
+    def __init__(self, path: str, max_entries: int = 50_000,
+                 max_bytes: int = 512 * 1024 * 1024, ttl_seconds: float = 30 * 24 * 3600):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")  # Lets several app processes share the file
+        self._conn.execute("PRAGMA recursive_triggers=ON")  # So INSERT OR REPLACE fires totals_delete
+        self._conn.executescript(_SCHEMA)
+
+    def _is_expired(self, created_at: float, now: float) -> bool:
+        return self.ttl_seconds is not None and now - created_at > self.ttl_seconds
+
+    def get(self, key: str):
+        """Returns the cached value for 'key', or None if missing or expired."""
+        return self.get_many([key]).get(key)
+
+    def get_many(self, keys: list) -> dict:
+        """Returns a {key: value} dict holding only the keys that were found."""
+        if not keys:
+            return {}
+        now = time.time()
+        found = {}
+        with self._lock:
+            # Stay well under SQLite's bound-parameter limit
+            for start in range(0, len(keys), 500):
+                batch = keys[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT key, value, created_at FROM entries WHERE key IN ({placeholders})",
+                    batch,
+                ).fetchall()
+                for key, value, created_at in rows:
+                    if not self._is_expired(created_at, now):
+                        found[key] = value
+            if found:
+                self._conn.executemany(
+                    "UPDATE entries SET accessed_at = ? WHERE key = ?",
+                    [(now, key) for key in found],
+                )
+                self._conn.commit()
+        return found
+
+    def set(self, key: str, value) -> None:
+        self.set_many({key: value})
+
+    def set_many(self, items: dict) -> None:
+        """Stores every (key, value) pair and then enforces the size limits."""
+        if not items:
+            return
+        now = time.time()
+        rows = [(key, value, _size_of(value), now, now) for key, value in items.items()]
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO entries (key, value, size, created_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                rows,
+            )
+            self._evict(now)
+            self._conn.commit()
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+            self._conn.commit()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM entries")
+            self._conn.commit()
+
+    def _evict(self, now: float) -> None:
+        """Drops expired entries, then least-recently-used ones until under the limits."""
+        if self.ttl_seconds is not None:
+            self._conn.execute("DELETE FROM entries WHERE created_at < ?", (now - self.ttl_seconds,))
+
+        count, total = self._conn.execute("SELECT count, bytes FROM totals").fetchone()
+        if count > self.max_entries:
+            self._conn.execute(_DELETE_OLDEST, (count - self.max_entries,))
+            total = self._conn.execute("SELECT bytes FROM totals").fetchone()[0]
+
+        # Over the byte limit: walk the oldest entries a batch at a time, not the whole table
+        while total > self.max_bytes:
+            rows = self._conn.execute("SELECT key, size FROM entries ORDER BY accessed_at ASC LIMIT ?",
+                                      (EVICT_BATCH,)).fetchall()
+            if not rows:
+                break
+            doomed = []
+            for key, size in rows:
+                if total <= self.max_bytes:
+                    break
+                doomed.append((key,))
+                total -= size
+            self._conn.executemany("DELETE FROM entries WHERE key = ?", doomed)
+
+
+class TieredCache:
+    """
+    An in-memory LRU in front of a shared SQLiteCache. Reads try memory first,
+    then the file (promoting what they find); writes go to both. The memory tier
+    is bounded by entries and bytes, and its entries expire after 'memory_ttl_seconds'
+    so values deleted or replaced by another process aren't served for long.
+    Hits per tier and misses are counted as cruxai_cache_{hits,misses}_total.
+    """
+
+    def __init__(self, name: str, store: SQLiteCache, memory_entries: int = 256,
+                 memory_bytes: int = 32 * 1024 * 1024, memory_ttl_seconds: float = 3600):
+        self.name = name
+        self.store = store
+        self.memory_entries = memory_entries
+        self.memory_bytes = memory_bytes
+        self.memory_ttl_seconds = memory_ttl_seconds
+        if store.ttl_seconds is not None:
+            self.memory_ttl_seconds = min(memory_ttl_seconds, store.ttl_seconds)
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0}
+        self._memory = OrderedDict()  # key -> (value, size, stored_at), least recently used first
+        self._memory_size = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: str):
+        """Returns the cached value for 'key', or None if neither tier has a live entry."""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None and now - entry[2] > self.memory_ttl_seconds:
+                self._drop(key)
+                entry = None
+            if entry is not None:
+                self._memory.move_to_end(key)
+                self.stats["memory_hits"] += 1
+        if entry is not None:
+            incr("cache_hits", cache=self.name, tier="memory")
+            return entry[0]
+
+        value = self.store.get(key)
+        with self._lock:
+            self.stats["disk_hits" if value is not None else "misses"] += 1
+        if value is None:
+            incr("cache_misses", cache=self.name)
+            return None
+        incr("cache_hits", cache=self.name, tier="disk")
+        self._remember(key, value)
+        return value
+
+    def set(self, key: str, value) -> None:
+        self.store.set(key, value)
+        self._remember(key, value)
+
+    def delete(self, key: str) -> None:
+        self.store.delete(key)
+        with self._lock:
+            self._drop(key)
+
+    def clear(self) -> None:
+        self.store.clear()
+        with self._lock:
+            self._memory.clear()
+            self._memory_size = 0
+
+    def _remember(self, key: str, value) -> None:
+        """Puts a value in the memory tier and evicts least-recently-used entries beyond its bounds."""
+        size = _size_of(value)
+        with self._lock:
+            self._drop(key)
+            if size > self.memory_bytes:
+                return  # Too big to keep in memory; the file still has it
+            self._memory[key] = (value, size, time.time())
+            self._memory_size += size
+            while len(self._memory) > self.memory_entries or self._memory_size > self.memory_bytes:
+                self._drop(next(iter(self._memory)))
+
+    def _drop(self, key: str) -> None:
+        """Removes 'key' from the memory tier. Called with the lock held."""
+        entry = self._memory.pop(key, None)
+        if entry is not None:
+            self._memory_size -= entry[1]
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def open_cache(name: str, **limits) -> SQLiteCache:
+    """
+    Returns the process-wide cache called 'name', stored in CACHE_DIR/<name>.sqlite.
+    'limits' are passed to SQLiteCache the first time the cache is opened.
+    """
+    with _caches_lock:
+        if name not in _caches:
+            _caches[name] = SQLiteCache(os.path.join(CACHE_DIR, f"{name}.sqlite"), **limits)
+        return _caches[name]
+
+
+def open_tiered_cache(name: str, memory_entries: int = 256, memory_bytes: int = 32 * 1024 * 1024,
+                      memory_ttl_seconds: float = 3600, **limits) -> TieredCache:
+    """
+    Returns the process-wide two-tier cache called 'name': a memory LRU in front
+    of open_cache(name, **limits), which every process using CACHE_DIR shares.
+    """
+    store = open_cache(name, **limits)
+    with _caches_lock:
+        if ("tiered", name) not in _caches:
+            _caches[("tiered", name)] = TieredCache(name, store, memory_entries, memory_bytes, memory_ttl_seconds)
+        return _caches[("tiered", name)]
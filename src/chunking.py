@@ -0,0 +1,88 @@
+import os
+import re
+from langchain_core.documents import Document
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+# "chars": fixed-size character chunks. "tokens": chunks packed up to a token target.
+CHUNKING_MODE = os.getenv("CRUXAI_CHUNKING", "tokens")
+
+CHUNK_SIZE = 8192
+CHUNK_OVERLAP = 200
+
+CHUNK_TOKEN_TARGET = int(os.getenv("CRUXAI_CHUNK_TOKENS", "16000"))
+CHUNK_TOKEN_OVERLAP = 100
+
+# Paragraphs first, then sentences, then clauses and words
+_SEPARATORS = ["\n\n", "\n", ". ", "? ", "! ", "; ", ", ", " ", ""]
+
+# Words are counted in pieces of up to 4 characters, punctuation one token each.
+# Close enough to Gemini's tokenizer on English text to pack chunks, and local.
+_TOKEN_PATTERN = re.compile(r"\w{1,4}|[^\w\s]")
+
+
+def count_tokens(text: str) -> int:
+    """Estimates the number of model tokens in 'text' without calling the API."""
+    return len(_TOKEN_PATTERN.findall(text))
+
+
+def make_splitter(mode: str = CHUNKING_MODE) -> RecursiveCharacterTextSplitter:
+    """Returns the text splitter for the given chunking mode."""
+    if mode == "tokens":
+        return RecursiveCharacterTextSplitter(
+            chunk_size=CHUNK_TOKEN_TARGET,
+            chunk_overlap=CHUNK_TOKEN_OVERLAP,
+            length_function=count_tokens,
+            separators=_SEPARATORS,
+            keep_separator="end"  # Sentences keep their full stop
+        )
+    if mode == "chars":
+        return RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+    raise ValueError(f"Unknown chunking mode: {mode}")
+
+
+def _chunk_chars(mode: str) -> int:
+    """Roughly how many characters make up one full chunk in this mode."""
+    return CHUNK_TOKEN_TARGET * 4 if mode == "tokens" else CHUNK_SIZE
+
+
+def split_documents(full_text: str, mode: str = CHUNKING_MODE) -> list:
+    """Splits a whole text into Documents with the splitter for 'mode'."""
+    return make_splitter(mode).create_documents([full_text])
+
+
+def chunk_stats(docs: list) -> dict:
+    """Returns the chunk count and token totals for a list of Documents."""
+    tokens = [count_tokens(doc.page_content) for doc in docs]
+    return {
+        "chunks": len(docs),
+        "total_tokens": sum(tokens),
+        "max_tokens": max(tokens, default=0),
+        "avg_tokens": sum(tokens) // len(tokens) if tokens else 0,
+    }
+
+
+def iter_chunks(text_blocks, mode: str = CHUNKING_MODE):
+    """
+    Incrementally splits a stream of text blocks (e.g. PDF pages) into Documents.
+    A chunk is yielded as soon as enough text has arrived to know it is complete,
+    so downstream work can start before the whole text exists. The last partial
+    chunk is carried over (with its overlap) and re-split once more text arrives.
+    """
+    splitter = make_splitter(mode)
+    chunk_chars = _chunk_chars(mode)
+    buffer = ""
+    for block in text_blocks:
+        if not block:
+            continue
+        buffer = f"{buffer} {block}" if buffer else block
+        # Wait for a couple of chunks' worth so every chunk but the tail is final
+        if len(buffer) < 2 * chunk_chars:
+            continue
+        chunks = splitter.split_text(buffer)
+        for chunk in chunks[:-1]:
+            yield Document(page_content=chunk)
+        buffer = chunks[-1] if chunks else ""
+
+    if buffer:
+        for chunk in splitter.split_text(buffer):
+            yield Document(page_content=chunk)
@@ -0,0 +1,214 @@
+"""
+Headless batch summarization, without Streamlit.
+
+    python -m src.cli reports/ extra.pdf https://example.com/post --output results.jsonl
+    python -m src.cli --manifest sources.txt --output results.jsonl
+
+Every finished document is appended to the output JSONL straight away. Running
+the same command again skips documents already recorded as "ok", and chunks
+summarized before an interruption come from the on-disk chunk cache, so an
+interrupted run picks up where it stopped.
+
+With --append every source is summarized again on each run, as a document that
+grows over time (e.g. a log export): only text added since the previous run is
+sent to the LLM.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from dotenv import load_dotenv
+
+import src.data_loader as loader
+import src.summarizer as processor
+import src.metrics as metrics
+from src.progress import ProgressReporter
+
+SUPPORTED_EXTENSIONS = (".pdf", ".txt")
+
+
+def _is_url(source: str) -> bool:
+    return source.startswith(("http://", "https://"))
+
+
+def collect_sources(inputs: list, manifest: str = None) -> list:
+    """
+    Expands the inputs into a list of sources: directories are walked for
+    .pdf/.txt files, and the manifest (one path or URL per line, '#' for
+    comments) is appended. Duplicates are dropped, order is kept.
+    """
+    sources = []
+    for item in inputs:
+        if os.path.isdir(item):
+            for directory, _, files in sorted(os.walk(item)):
+                sources += [os.path.join(directory, name) for name in sorted(files)
+                            if name.lower().endswith(SUPPORTED_EXTENSIONS)]
+        else:
+            sources.append(item)
+
+    if manifest:
+        with open(manifest, encoding="utf-8") as f:
+            sources += [line.strip() for line in f if line.strip() and not line.strip().startswith("#")]
+    return list(dict.fromkeys(sources))
+
+
+def load_source(source: str) -> str:
+    """Loads one source (PDF, TXT or URL) into text. Runs in a loader process."""
+    if _is_url(source):
+        return loader.load_blog_url(source)
+    if source.lower().endswith(".pdf"):
+        # Documents are already spread over processes, so don't start a pool per PDF
+        return loader.load_pdf(source, workers=1)
+    return loader.load_text_file(source)
+
+
+def completed_ids(output_path: str) -> set:
+    """Returns the ids of documents already summarized successfully in 'output_path'."""
+    done = set()
+    if not os.path.exists(output_path):
+        return done
+    with open(output_path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue  # A line cut short by an interruption
+            if record.get("status") == "ok":
+                done.add(record["id"])
+    return done
+
+
+def _summarize_source(source: str, load_future, token_budget: int, on_event, append: bool = False) -> dict:
+    """Waits for a source's text and summarizes it, collecting warnings and errors."""
+    started = time.perf_counter()
+    record = {"id": source, "source": source, "status": "ok", "summary": None,
+              "chars": 0, "warnings": [], "errors": [], "seconds": 0.0}
+
+    def on_progress(level, message):
+        if level == "warning":
+            record["warnings"].append(message)
+        elif level == "error":
+            record["errors"].append(message)
+        on_event({"source": source, "level": level, "message": message})
+
+    reporter = ProgressReporter(on_progress)
+
+    with metrics.trace("document", source=source) as trace:
+        try:
+            # Loading runs in another process; this is the time spent waiting for it
+            with metrics.span("load.wait"):
+                text = load_future.result()
+            record["chars"] = len(text)
+            if len(text.strip()) < 50:
+                record["errors"].append("Content is too short or invalid.")
+            else:
+                if append:
+                    record["summary"] = processor.summarize_append(source, text, on_progress=reporter)
+                else:
+                    record["summary"] = processor.summarize_document(text, token_budget=token_budget, on_progress=reporter)
+                if not reporter.complete:
+                    # Empty results and skipped chunks only produce warnings; don't checkpoint them as done
+                    record["errors"].append(f"Incomplete summary: {record['summary']}")
+        except Exception as e:
+            record["errors"].append(str(e))
+    record["metrics"] = trace.summary()
+
+    if record["errors"]:
+        record["status"] = "error"
+    record["seconds"] = round(time.perf_counter() - started, 3)
+    return record
+
+
+def run_batch(sources: list, output_path: str, load_workers: int = None, doc_concurrency: int = 4,
+              token_budget: int = None, on_event=None, append: bool = False) -> dict:
+    """
+    Summarizes every source not yet recorded as "ok" in 'output_path' and appends
+    one JSON record per document. Sources are loaded in a process pool of
+    'load_workers' processes while up to 'doc_concurrency' documents are being
+    summarized at once (their LLM calls share the process-wide rate limiter).
+    'on_event(dict)' receives progress events. Returns counts per status.
+    With 'append', sources already done are summarized again in append mode
+    (see summarizer.summarize_append), keyed by their path or URL.
+    """
+    on_event = on_event or (lambda event: None)
+    done = set() if append else completed_ids(output_path)
+    pending = [source for source in sources if source not in done]
+    counts = {"skipped": len(sources) - len(pending), "ok": 0, "error": 0}
+    on_event({"level": "info", "message": f"{len(pending)} to summarize, {counts['skipped']} already done"})
+
+    write_lock = threading.Lock()
+    # Bounds loaded-but-unsummarized documents, so a 10k-document run doesn't hold every text at once
+    window = threading.BoundedSemaphore(doc_concurrency * 2)
+
+    def finish(future):
+        window.release()
+        record = future.result()
+        with write_lock:
+            out.write(json.dumps(record, ensure_ascii=False) + "\n")
+            out.flush()
+            counts[record["status"]] += 1
+        on_event({"source": record["id"], "final": True, "level": "info" if record["status"] == "ok" else "error",
+                  "message": f"{record['status']} in {record['seconds']}s "
+                             f"({counts['ok'] + counts['error']}/{len(pending)})"})
+
+    with open(output_path, "a", encoding="utf-8") as out, \
+            ProcessPoolExecutor(max_workers=load_workers, mp_context=loader.PROCESS_POOL_CONTEXT) as loaders, \
+            ThreadPoolExecutor(max_workers=doc_concurrency) as summarizers:
+        futures = []
+        for source in pending:
+            window.acquire()
+            load_future = loaders.submit(load_source, source)
+            future = summarizers.submit(_summarize_source, source, load_future, token_budget, on_event, append)
+            future.add_done_callback(finish)
+            futures.append(future)
+        for future in futures:
+            future.exception()  # Wait for everything; errors are already in the records
+    return counts
+
+
+def main(argv: list = None) -> int:
+    parser = argparse.ArgumentParser(description="Summarize a batch of PDFs, text files and URLs to JSONL.")
+    parser.add_argument("inputs", nargs="*", help="Files, directories (searched for .pdf/.txt) or URLs")
+    parser.add_argument("--manifest", help="File listing one path or URL per line")
+    parser.add_argument("--output", required=True, help="JSONL file to append results to (also the resume checkpoint)")
+    parser.add_argument("--load-workers", type=int, default=None, help="Loader processes (default: one per CPU)")
+    parser.add_argument("--concurrency", type=int, default=4, help="Documents summarized at the same time")
+    parser.add_argument("--token-budget", type=int, default=None, help="Enable budget mode with this many tokens")
+    parser.add_argument("--append", action="store_true",
+                        help="Treat sources as growing documents: re-summarize them, sending only new text to the LLM")
+    parser.add_argument("--quiet", action="store_true", help="Only print per-document results")
+    parser.add_argument("--metrics-file", help="Write Prometheus-format metrics here when the run ends")
+    args = parser.parse_args(argv)
+
+    load_dotenv()
+    if not os.getenv("GOOGLE_API_KEY"):
+        print("GOOGLE_API_KEY not found in environment.", file=sys.stderr)
+        return 2
+
+    sources = collect_sources(args.inputs, args.manifest)
+    if not sources:
+        parser.error("no inputs given")
+    if args.append and args.token_budget:
+        parser.error("--append can't be combined with --token-budget")
+
+    def print_event(event):
+        if args.quiet and "source" in event and not event.get("final"):
+            return
+        prefix = f"[{event['source']}] " if "source" in event else ""
+        print(f"{event['level'].upper():7} {prefix}{event['message']}", file=sys.stderr, flush=True)
+
+    counts = run_batch(sources, args.output, args.load_workers, args.concurrency, args.token_budget, print_event,
+                       args.append)
+    if args.metrics_file:
+        with open(args.metrics_file, "w", encoding="utf-8") as f:
+            f.write(metrics.render_prometheus())
+    print(f"Done: {counts['ok']} ok, {counts['error']} failed, {counts['skipped']} skipped (already done).",
+          file=sys.stderr)
+    return 1 if counts["error"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,90 @@
+import re
+import zlib
+import numpy as np
+
+# MinHash signature length, split into LSH bands of NUM_PERM // LSH_BANDS rows.
+# 16 bands x 8 rows makes chunks with Jaccard similarity above ~0.7 collide
+# with high probability; candidates are then checked against SIMILARITY_THRESHOLD.
+NUM_PERM = 128
+LSH_BANDS = 16
+SIMILARITY_THRESHOLD = 0.85
+SHINGLE_WORDS = 5
+
+_MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+_MAX_HASH = np.uint64((1 << 32) - 1)
+_WORD_PATTERN = re.compile(r"\w+")
+
+# Fixed seed so signatures are comparable across runs and processes
+_rng = np.random.default_rng(1)
+_PERM_A = _rng.integers(1, 1 << 32, size=NUM_PERM, dtype=np.uint64)
+_PERM_B = _rng.integers(0, 1 << 32, size=NUM_PERM, dtype=np.uint64)
+
+
+def _shingle_hashes(text: str) -> np.ndarray:
+    """Returns the 32-bit hashes of the text's word shingles (lower-cased, punctuation ignored)."""
+    words = _WORD_PATTERN.findall(text.lower())
+    if len(words) < SHINGLE_WORDS:
+        shingles = [" ".join(words)]
+    else:
+        shingles = {" ".join(words[i:i + SHINGLE_WORDS]) for i in range(len(words) - SHINGLE_WORDS + 1)}
+    return np.fromiter((zlib.crc32(s.encode("utf-8")) for s in shingles), dtype=np.uint64)
+
+
+def minhash_signature(text: str) -> np.ndarray:
+    """Computes the MinHash signature of a text (all permutations at once with NumPy)."""
+    hashes = _shingle_hashes(text)
+    # (a * h + b) mod p: a, h < 2^32 so the product fits in uint64
+    permuted = (np.outer(_PERM_A, hashes) + _PERM_B[:, None]) % _MERSENNE_PRIME & _MAX_HASH
+    return permuted.min(axis=1)
+
+
+class NearDuplicateIndex:
+    """
+    Incremental MinHash/LSH index. Each added text is compared with the texts
+    added before it; near-duplicates are mapped to the first text of their cluster.
+    """
+
+    def __init__(self, threshold: float = SIMILARITY_THRESHOLD):
+        self.threshold = threshold
+        self.rows = NUM_PERM // LSH_BANDS
+        self.signatures = []
+        self.buckets = [{} for _ in range(LSH_BANDS)]
+
+    def add(self, text: str):
+        """
+        Adds a text and returns the index of the earlier representative it
+        duplicates, or None if it starts a new cluster.
+        """
+        signature = minhash_signature(text)
+        index = len(self.signatures)
+        self.signatures.append(signature)
+
+        bands = [signature[b * self.rows:(b + 1) * self.rows].tobytes() for b in range(LSH_BANDS)]
+        candidates = set()
+        for bucket, band in zip(self.buckets, bands):
+            candidates.update(bucket.get(band, ()))
+
+        representative = None
+        for candidate in sorted(candidates):
+            if np.mean(self.signatures[candidate] == signature) >= self.threshold:
+                representative = candidate
+                break
+
+        # Only representatives go into the buckets, so clusters don't chain
+        if representative is None:
+            for bucket, band in zip(self.buckets, bands):
+                bucket.setdefault(band, []).append(index)
+        return representative
+
+
+def find_representatives(texts: list, threshold: float = SIMILARITY_THRESHOLD) -> list:
+    """
+    Returns, for each text, the index of the text whose result it can reuse:
+    itself for the first member of a near-duplicate cluster, otherwise that member.
+    """
+    index = NearDuplicateIndex(threshold)
+    representatives = []
+    for i, text in enumerate(texts):
+        representative = index.add(text)
+        representatives.append(i if representative is None else representative)
+    return representatives
@@ -0,0 +1,153 @@
+import re
+import numpy as np
+from src.chunking import count_tokens
+
+_SENTENCE_BOUNDARY = re.compile(r"(?<=[.!?])\s+")
+_WORD_PATTERN = re.compile(r"\w+")
+
+DAMPING = 0.85
+MAX_ITERATIONS = 50
+TOLERANCE = 1e-6
+
+# Longer "sentences" (transcripts and logs often have no full stops) are split
+# on line breaks, then into runs of words, so each unit can fit in a budget
+MAX_SENTENCE_TOKENS = 256
+
+
+def _split_long(sentence: str) -> list:
+    """Splits an over-long sentence into lines, and lines into word runs of up to MAX_SENTENCE_TOKENS."""
+    pieces = []
+    for line in sentence.splitlines():
+        if count_tokens(line) <= MAX_SENTENCE_TOKENS:
+            if line.strip():
+                pieces.append(line.strip())
+            continue
+        current, used = [], 0
+        for word in line.split():
+            tokens = count_tokens(word)
+            if current and used + tokens > MAX_SENTENCE_TOKENS:
+                pieces.append(" ".join(current))
+                current, used = [], 0
+            current.append(word)
+            used += tokens
+        if current:
+            pieces.append(" ".join(current))
+    return pieces
+
+
+def split_sentences(text: str) -> list:
+    sentences = []
+    for sentence in _SENTENCE_BOUNDARY.split(text):
+        if count_tokens(sentence) > MAX_SENTENCE_TOKENS:
+            sentences += _split_long(sentence)
+        elif sentence.strip():
+            sentences.append(sentence)
+    return sentences
+
+
+def _truncate(sentence: str, token_budget: int) -> str:
+    """The longest run of leading words of 'sentence' within 'token_budget' tokens (at least one word)."""
+    words, used = sentence.split(), 0
+    for count, word in enumerate(words):
+        used += count_tokens(word)
+        if used > token_budget:
+            return " ".join(words[:max(count, 1)])
+    return sentence
+
+
+def _tfidf_matrix(sentences: list) -> tuple:
+    """
+    Builds the L2-normalised sentence x term TF-IDF matrix in coordinate form
+    and returns (rows, cols, weights, num_terms). NumPy has no sparse type, so
+    the matrix is kept as parallel (row, col, value) arrays.
+    """
+    vocabulary = {}
+    term_ids, lengths = [], []
+    for sentence in sentences:
+        words = _WORD_PATTERN.findall(sentence.lower())
+        term_ids.extend(vocabulary.setdefault(word, len(vocabulary)) for word in words)
+        lengths.append(len(words))
+
+    num_terms = max(len(vocabulary), 1)
+    rows = np.repeat(np.arange(len(sentences), dtype=np.int64), lengths)
+    terms = np.asarray(term_ids, dtype=np.int64)
+
+    # Collapse repeated (sentence, term) pairs into term frequencies
+    pairs, tf = np.unique(rows * num_terms + terms, return_counts=True)
+    rows, cols = pairs // num_terms, pairs % num_terms
+
+    df = np.bincount(cols, minlength=num_terms)
+    idf = np.log((1 + len(sentences)) / (1 + df)) + 1
+    weights = (1 + np.log(tf)) * idf[cols]
+
+    norms = np.sqrt(np.bincount(rows, weights=weights ** 2, minlength=len(sentences)))
+    weights = weights / norms[rows]
+    return rows, cols, weights, num_terms
+
+
+def textrank_scores(sentences: list) -> np.ndarray:
+    """
+    Scores sentences by PageRank centrality over their cosine-similarity graph.
+    The n x n similarity matrix S = X X^T is never built: every product S v is
+    computed as X (X^T v) with two sparse matrix-vector products, so the cost per
+    iteration is linear in the number of (sentence, term) entries.
+    """
+    n = len(sentences)
+    if n == 0:
+        return np.zeros(0)
+    rows, cols, weights, num_terms = _tfidf_matrix(sentences)
+    # Rows are unit length (or empty), so this is S's diagonal: each sentence's self-similarity
+    self_similarity = np.bincount(rows, weights=weights ** 2, minlength=n)
+
+    def similarity_times(vector):
+        term_totals = np.bincount(cols, weights=weights * vector[rows], minlength=num_terms)
+        return np.bincount(rows, weights=weights * term_totals[cols], minlength=n) - self_similarity * vector
+
+    degree = similarity_times(np.ones(n))
+    has_edges = degree > 1e-12
+    scores = np.full(n, 1.0 / n)
+    for _ in range(MAX_ITERATIONS):
+        spread = np.where(has_edges, scores / np.where(has_edges, degree, 1), 0)
+        # Sentences with no edges hand their score back to everyone, like teleporting
+        dangling = scores[~has_edges].sum()
+        updated = (1 - DAMPING) / n + DAMPING * (similarity_times(spread) + dangling / n)
+        converged = np.abs(updated - scores).sum() < TOLERANCE
+        scores = updated
+        if converged:
+            break
+    return scores
+
+
+def select_sentences(text: str, token_budget: int) -> tuple:
+    """
+    Keeps the most central sentences of 'text' up to 'token_budget' (estimated)
+    tokens, in their original order. Returns (filtered_text, stats).
+    Sentences are taken in rank order, skipping any that no longer fit. For
+    non-empty text the result is never empty: if not even the top sentence fits,
+    its leading words are kept.
+    """
+    sentences = split_sentences(text)
+    tokens = np.fromiter((count_tokens(sentence) for sentence in sentences), dtype=np.int64, count=len(sentences))
+    total_tokens = int(tokens.sum())
+    stats = {"sentences_in": len(sentences), "sentences_kept": len(sentences),
+             "tokens_in": total_tokens, "tokens_kept": total_tokens}
+    if total_tokens <= token_budget:
+        return text, stats
+
+    order = np.argsort(-textrank_scores(sentences), kind="stable")
+    keep, remaining, smallest = [], token_budget, int(tokens.min())
+    for i in order:
+        if tokens[i] <= remaining:
+            keep.append(i)
+            remaining -= tokens[i]
+            if remaining < smallest:
+                break
+    if not keep:
+        top = _truncate(sentences[order[0]], token_budget)
+        stats["sentences_kept"], stats["tokens_kept"] = 1, count_tokens(top)
+        return top, stats
+
+    keep.sort()
+    stats["sentences_kept"] = len(keep)
+    stats["tokens_kept"] = int(tokens[keep].sum())
+    return " ".join(sentences[i] for i in keep), stats
@@ -0,0 +1,165 @@
+import os
+import time
+import uuid
+import threading
+from collections import deque, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from src.progress import ProgressReporter, SummaryCancelled
+from src.metrics import trace
+
+JOB_WORKERS = int(os.getenv("CRUXAI_JOB_WORKERS", "4"))
+MAX_JOBS = 200          # Finished jobs kept for polling before the oldest are dropped
+MAX_JOB_MESSAGES = 50
+
+FINISHED_STATES = ("done", "failed", "cancelled")
+
+
+class Job:
+    """State of one background summarization, updated by its worker and polled by the UI."""
+
+    def __init__(self, key: str):
+        self.id = uuid.uuid4().hex
+        self.key = key
+        self.status = "queued"
+        self.stage = None
+        self.map_done = 0
+        self.map_total = None
+        self.reduce_level = 0
+        self.messages = deque(maxlen=MAX_JOB_MESSAGES)
+        self.partial = []        # Final summary text streamed so far
+        self.first_token = None
+        self.result = None
+        self.error = None
+        self.created = time.time()
+        self.finished = None
+        self.trace = None        # Spans and counters of the run (src.metrics.Trace)
+        self.cancel_event = threading.Event()
+        self.lock = threading.Lock()
+
+    @property
+    def active(self) -> bool:
+        return self.status not in FINISHED_STATES
+
+    def snapshot(self) -> dict:
+        """Returns a consistent copy of the job's state for display."""
+        with self.lock:
+            return {
+                "id": self.id,
+                "status": self.status,
+                "stage": self.stage,
+                "map_done": self.map_done,
+                "map_total": self.map_total,
+                "reduce_level": self.reduce_level,
+                "messages": list(self.messages),
+                "partial": "".join(self.partial),
+                # Time to first token as the user sees it: from submitting the job
+                "ttft": self.first_token - self.created if self.first_token else None,
+                "result": self.result,
+                "error": self.error,
+                "elapsed": (self.finished or time.time()) - self.created,
+            }
+
+
+class JobReporter(ProgressReporter):
+    """ProgressReporter that records progress on a Job and stops the pipeline when it is cancelled."""
+
+    def __init__(self, job: Job):
+        super().__init__()
+        self.job = job
+
+    def _emit(self, level: str, message: str) -> None:
+        with self.job.lock:
+            self.job.messages.append((level, message))
+
+    def step(self, stage: str, done: int, total: int = None) -> None:
+        with self.job.lock:
+            self.job.stage = stage
+            if stage == "map":
+                self.job.map_done, self.job.map_total = done, total
+            elif stage == "reduce":
+                self.job.reduce_level = done
+
+    def token(self, text: str) -> None:
+        with self.job.lock:
+            if self.job.first_token is None and text:
+                self.job.first_token = time.time()
+            self.job.partial.append(text)
+
+    def check_cancelled(self) -> None:
+        if self.job.cancel_event.is_set():
+            raise SummaryCancelled(f"Job {self.job.id} was cancelled.")
+
+
+class JobManager:
+    """
+    Runs summarization jobs on one bounded worker pool shared by every session.
+    Jobs are identified by a caller-chosen key (e.g. a hash of the input and
+    settings): submitting a key that is already queued, running or done returns
+    that job instead of starting a second one.
+    """
+
+    def __init__(self, max_workers: int = JOB_WORKERS, max_jobs: int = MAX_JOBS):
+        self.max_jobs = max_jobs
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="cruxai-job")
+        self._jobs = OrderedDict()
+        self._by_key = {}
+        self._lock = threading.Lock()
+
+    def submit(self, key: str, fn) -> Job:
+        """
+        Queues fn(reporter) and returns its Job. 'fn' receives a JobReporter to
+        pass as the summarizer's on_progress; its return value becomes job.result.
+        If the summarizer reports the result as incomplete, the job fails with
+        that text as its error, so submitting the same key again retries it.
+        """
+        with self._lock:
+            existing = self._jobs.get(self._by_key.get(key))
+            if existing is not None and existing.status not in ("failed", "cancelled"):
+                return existing
+            job = Job(key)
+            self._jobs[job.id] = job
+            self._by_key[key] = job.id
+            self._prune()
+        self._pool.submit(self._run, job, fn)
+        return job
+
+    def _run(self, job: Job, fn) -> None:
+        reporter = JobReporter(job)
+        try:
+            reporter.check_cancelled()  # Cancelled while still queued
+            with job.lock:
+                job.status = "running"
+            with trace("job", job=job.id) as job.trace:
+                result = fn(reporter)
+            if reporter.complete is False:
+                # A failure message or partial summary: report it, and let the next submit retry
+                result, status, error = None, "failed", result
+            else:
+                status, error = "done", None
+        except SummaryCancelled:
+            result, status, error = None, "cancelled", None
+        except Exception as e:
+            result, status, error = None, "failed", str(e)
+        with job.lock:
+            job.result, job.status, job.error = result, status, error
+            job.finished = time.time()
+
+    def get(self, job_id: str):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def cancel(self, job_id: str) -> bool:
+        """Asks a job to stop; it ends at its next LLM call boundary. Returns False if it already finished."""
+        job = self.get(job_id)
+        if job is None or not job.active:
+            return False
+        job.cancel_event.set()
+        return True
+
+    def _prune(self) -> None:
+        """Drops the oldest finished jobs beyond max_jobs. Called with the lock held."""
+        excess = len(self._jobs) - self.max_jobs
+        for job_id in [job_id for job_id, job in self._jobs.items() if not job.active][:max(excess, 0)]:
+            job = self._jobs.pop(job_id)
+            if self._by_key.get(job.key) == job_id:
+                del self._by_key[job.key]
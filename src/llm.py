@@ -0,0 +1,148 @@
+import os
+import asyncio
+import threading
+import contextvars
+import concurrent.futures
+from langchain_google_genai import ChatGoogleGenerativeAI
+from google.generativeai.types import HarmCategory, HarmBlockThreshold
+from src.metrics import LLMMetricsHandler, install_retry_counter
+
+MODEL_NAME = "gemini-2.5-pro"
+
+# Model per pipeline stage: a fast, cheap model for the many map calls and the
+# strong one for the reduce step and the bonus outputs
+STAGE_MODELS = {
+    "map": os.getenv("CRUXAI_MAP_MODEL", "gemini-2.5-flash"),
+    "reduce": os.getenv("CRUXAI_REDUCE_MODEL", MODEL_NAME),
+    "extras": os.getenv("CRUXAI_EXTRAS_MODEL", MODEL_NAME),
+}
+
+# This prevents the model from returning a blank response due to safety filters
+SAFETY_SETTINGS = {
+    HarmCategory.HARM_CATEGORY_HARASSMENT: HarmBlockThreshold.BLOCK_NONE,
+    HarmCategory.HARM_CATEGORY_HATE_SPEECH: HarmBlockThreshold.BLOCK_NONE,
+    HarmCategory.HARM_CATEGORY_SEXUALLY_EXPLICIT: HarmBlockThreshold.BLOCK_NONE,
+    HarmCategory.HARM_CATEGORY_DANGEROUS_CONTENT: HarmBlockThreshold.BLOCK_NONE,
+}
+
+# Process-wide clients keyed by their settings. Each client keeps its own
+# connection to the API open, so reusing it skips setup on every request.
+_clients = {}
+_clients_lock = threading.Lock()
+
+# Records latency, tokens and cost of every call made through these clients
+_metrics_handler = LLMMetricsHandler()
+
+# When set, get_llm builds clients with this instead of ChatGoogleGenerativeAI
+_llm_factory = None
+
+
+def model_for(stage: str) -> str:
+    """Returns the model configured for a pipeline stage ("map", "reduce" or "extras")."""
+    return STAGE_MODELS[stage]
+
+
+def set_llm_factory(factory) -> None:
+    """
+    Replaces the chat model class for the whole process, e.g. with a local fake
+    for benchmarks: factory(model, temperature, max_retries) must return a
+    LangChain chat model. Pass None to go back to Gemini. Drops cached clients.
+    """
+    global _llm_factory
+    with _clients_lock:
+        _llm_factory = factory
+        _clients.clear()
+
+
+def get_llm(model: str = MODEL_NAME, temperature: float = 0.3, max_retries: int = 5) -> ChatGoogleGenerativeAI:
+    """
+    Returns the shared ChatGoogleGenerativeAI client for these settings, creating
+    it on first use. Safe to call from any thread or Streamlit session.
+    Reads the API key from the environment.
+    """
+    key = (model, temperature, max_retries)
+    client = _clients.get(key)
+    if client is not None:
+        return client
+
+    with _clients_lock:
+        if key not in _clients and _llm_factory is not None:
+            client = _llm_factory(model, temperature, max_retries)
+            client.callbacks = [_metrics_handler]
+            _clients[key] = client
+        if key not in _clients:
+            api_key = os.getenv("GOOGLE_API_KEY")
+            if not api_key:
+                raise ValueError("GOOGLE_API_KEY not found in environment.")
+            install_retry_counter()
+            _clients[key] = ChatGoogleGenerativeAI(
+                model=model,
+                google_api_key=api_key,
+                temperature=temperature,
+                max_retries=max_retries,
+                safety_settings=SAFETY_SETTINGS,
+                callbacks=[_metrics_handler]
+            )
+        return _clients[key]
+
+
+# The async side of a client binds to the first event loop it is used on, so all
+# async LLM work in the process runs on this one long-lived loop.
+_loop = None
+_loop_lock = threading.Lock()
+
+
+def _get_loop() -> asyncio.AbstractEventLoop:
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="cruxai-llm-loop", daemon=True).start()
+        return _loop
+
+
+def run_async(coro):
+    """
+    Runs 'coro' on the shared LLM event loop and blocks until it returns. The
+    coroutine sees the caller's context variables (e.g. the active metrics trace).
+    """
+    loop = _get_loop()
+    context = contextvars.copy_context()
+    result = concurrent.futures.Future()
+
+    def copy_outcome(task):
+        if task.cancelled():
+            result.cancel()
+        elif task.exception() is not None:
+            result.set_exception(task.exception())
+        else:
+            result.set_result(task.result())
+
+    def start():
+        # A task copies the context it's created in, so create it inside the caller's
+        task = context.run(loop.create_task, coro)
+        task.add_done_callback(copy_outcome)
+
+    loop.call_soon_threadsafe(start)
+    return result.result()
+
+
+def warm_up(ping: bool = False) -> None:
+    """
+    Creates the clients the summarizer uses so the first request doesn't pay for
+    setup. With 'ping', also sends a tiny request to open the API connection
+    (this uses one call of quota).
+    """
+    client = get_llm(model_for("reduce"))
+    get_llm(model_for("extras"))
+    # The async map step (and its escalations) use single-attempt clients
+    get_llm(model_for("map"), max_retries=1)
+    get_llm(model_for("reduce"), max_retries=1)
+    if ping:
+        client.invoke("ping")
+
+
+def clear_clients() -> None:
+    """Drops every cached client, e.g. after the API key changes."""
+    with _clients_lock:
+        _clients.clear()
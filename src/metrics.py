@@ -0,0 +1,314 @@
+import os
+import re
+import time
+import uuid
+import logging
+import threading
+import contextvars
+from collections import defaultdict
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from langchain_core.callbacks import BaseCallbackHandler
+from src.chunking import count_tokens
+from src.rate_limiter import is_rate_limit_error
+
+# USD per million (input, output) tokens, from the public price list; estimates only
+MODEL_PRICES = {
+    "gemini-2.5-pro": (1.25, 10.00),
+    "gemini-2.5-flash": (0.30, 2.50),
+    "gemini-2.5-flash-lite": (0.10, 0.40),
+}
+
+MAX_SPANS_PER_TRACE = 5000
+
+# The trace that spans and counters on this thread/task are recorded into
+_current_trace = contextvars.ContextVar("cruxai_trace", default=None)
+
+
+class Trace:
+    """
+    Spans and counters recorded while one document is processed. Everything
+    recorded into a trace also goes into the process-wide Prometheus metrics.
+    """
+
+    def __init__(self, name: str, **attrs):
+        self.id = uuid.uuid4().hex
+        self.name = name
+        self.attrs = attrs
+        self.started = time.time()
+        self.seconds = None
+        self.spans = []
+        self.dropped_spans = 0
+        self.counters = defaultdict(float)
+        self.lock = threading.Lock()
+
+    def add_span(self, name: str, started: float, seconds: float, attrs: dict) -> None:
+        with self.lock:
+            if len(self.spans) < MAX_SPANS_PER_TRACE:
+                self.spans.append({"name": name, "start": round(started - self.started, 6),
+                                   "seconds": round(seconds, 6), **attrs})
+            else:
+                self.dropped_spans += 1
+
+    def incr(self, name: str, value: float = 1) -> None:
+        with self.lock:
+            self.counters[name] += value
+
+    def summary(self) -> dict:
+        """Per-stage totals, LLM use per (pipeline stage, model) and the counters, without the individual spans."""
+        with self.lock:
+            stages, models = {}, {}
+            for span in self.spans:
+                stage = stages.setdefault(span["name"], {"count": 0, "seconds": 0.0, "max_seconds": 0.0})
+                stage["count"] += 1
+                stage["seconds"] = round(stage["seconds"] + span["seconds"], 6)
+                stage["max_seconds"] = max(stage["max_seconds"], span["seconds"])
+                if span["name"] == "llm.call":
+                    use = models.setdefault(f"{span['stage']}/{span['model']}", {
+                        "calls": 0, "seconds": 0.0, "input_tokens": 0, "output_tokens": 0, "cost_usd": 0.0})
+                    use["calls"] += 1
+                    use["seconds"] = round(use["seconds"] + span["seconds"], 6)
+                    use["input_tokens"] += span["input_tokens"]
+                    use["output_tokens"] += span["output_tokens"]
+                    use["cost_usd"] = round(use["cost_usd"] + span["cost_usd"], 6)
+            return {
+                "id": self.id,
+                "name": self.name,
+                **self.attrs,
+                "seconds": round(self.seconds if self.seconds is not None else time.time() - self.started, 6),
+                "stages": stages,
+                "models": models,
+                "counters": {name: round(value, 6) for name, value in self.counters.items()},
+            }
+
+    def to_dict(self) -> dict:
+        """The full trace: summary() plus every span, in start order."""
+        result = self.summary()
+        with self.lock:
+            result["spans"] = sorted(self.spans, key=lambda span: span["start"])
+            result["dropped_spans"] = self.dropped_spans
+        return result
+
+
+class _Registry:
+    """Process-wide counters and timing summaries, rendered in the Prometheus text format."""
+
+    def __init__(self):
+        self.counters = defaultdict(float)
+        self.timings = defaultdict(lambda: [0, 0.0])  # (name, labels) -> [count, sum]
+        self.lock = threading.Lock()
+
+    def incr(self, name: str, value: float, labels: tuple) -> None:
+        with self.lock:
+            self.counters[(name, labels)] += value
+
+    def observe(self, name: str, seconds: float, labels: tuple) -> None:
+        with self.lock:
+            timing = self.timings[(name, labels)]
+            timing[0] += 1
+            timing[1] += seconds
+
+    def render(self) -> str:
+        def fmt(labels):
+            if not labels:
+                return ""
+            return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels) + "}"
+
+        lines = []
+        with self.lock:
+            for name in sorted({name for name, _ in self.counters}):
+                lines.append(f"# TYPE {name} counter")
+                lines += [f"{name}{fmt(labels)} {value:g}"
+                          for (metric, labels), value in sorted(self.counters.items()) if metric == name]
+            for name in sorted({name for name, _ in self.timings}):
+                lines.append(f"# TYPE {name} summary")
+                for (metric, labels), (count, total) in sorted(self.timings.items()):
+                    if metric == name:
+                        lines.append(f"{name}_count{fmt(labels)} {count}")
+                        lines.append(f"{name}_sum{fmt(labels)} {total:.6f}")
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+_registry = _Registry()
+
+
+def _labels(labels: dict) -> tuple:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+@contextmanager
+def trace(name: str, **attrs):
+    """
+    Starts a trace for one document; spans and counters recorded inside the block
+    (in this thread, and in work it hands to the shared LLM loop) go into it.
+    """
+    current = Trace(name, **attrs)
+    token = _current_trace.set(current)
+    try:
+        yield current
+    finally:
+        current.seconds = time.time() - current.started
+        _current_trace.reset(token)
+
+
+def current_trace():
+    return _current_trace.get()
+
+
+def record_span(name: str, seconds: float, started: float = None, **attrs) -> None:
+    """Records a span timed elsewhere (e.g. in a worker process)."""
+    started = started if started is not None else time.time() - seconds
+    current = _current_trace.get()
+    if current is not None:
+        current.add_span(name, started, seconds, attrs)
+    _registry.observe("cruxai_stage_seconds", seconds, (("stage", name),))
+
+
+@contextmanager
+def span(name: str, **attrs):
+    """
+    Times the block as a span called 'name'. Yields the attrs dict, so the block
+    can attach results (e.g. a chunk count) that are only known at the end.
+    """
+    started, clock = time.time(), time.perf_counter()
+    try:
+        yield attrs
+    except BaseException as e:
+        attrs["error"] = type(e).__name__
+        raise
+    finally:
+        record_span(name, time.perf_counter() - clock, started, **attrs)
+
+
+def incr(name: str, value: float = 1, **labels) -> None:
+    """Adds to counter 'name' in the current trace and to cruxai_<name>_total."""
+    current = _current_trace.get()
+    if current is not None:
+        current.incr(name, value)
+    _registry.incr(f"cruxai_{name}_total", value, _labels(labels))
+
+
+def estimate_cost(model: str, input_tokens: int, output_tokens: int) -> float:
+    """Estimated USD cost of a call; 0 for models without a known price."""
+    input_price, output_price = MODEL_PRICES.get(model, (0.0, 0.0))
+    return (input_tokens * input_price + output_tokens * output_price) / 1_000_000
+
+
+def record_llm_call(model: str, seconds: float, input_tokens: int, output_tokens: int,
+                    started: float = None, estimated: bool = False, stage: str = "other") -> None:
+    """Records one completed LLM call: its span, token counts and estimated cost, per stage and model."""
+    cost = estimate_cost(model, input_tokens, output_tokens)
+    record_span("llm.call", seconds, started, model=model, stage=stage, input_tokens=input_tokens,
+                output_tokens=output_tokens, cost_usd=cost, estimated_tokens=estimated)
+    incr("llm_calls", model=model, stage=stage)
+    incr("input_tokens", input_tokens, model=model, stage=stage)
+    incr("output_tokens", output_tokens, model=model, stage=stage)
+    incr("cost_usd", cost, model=model, stage=stage)
+
+
+def render_prometheus() -> str:
+    """Every metric recorded in this process, in the Prometheus text exposition format."""
+    return _registry.render()
+
+
+class LLMMetricsHandler(BaseCallbackHandler):
+    """
+    LangChain callback that records every chat model call. Token counts come from
+    the response's usage metadata, or from the local estimate when it has none.
+    The pipeline stage is read from a "stage:<name>" tag on the calling chain.
+    """
+
+    run_inline = True  # Run in the caller's context, so the active trace is visible
+
+    def __init__(self):
+        self._calls = {}
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, tags=None, metadata=None, **kwargs):
+        model = (metadata or {}).get("ls_model_name") or (serialized or {}).get("kwargs", {}).get("model", "unknown")
+        prompt = "".join(str(message.content) for batch in messages for message in batch)
+        # Nested chains inherit their parents' tags, so the innermost (last) stage wins
+        stages = [tag.removeprefix("stage:") for tag in tags or () if tag.startswith("stage:")]
+        self._calls[run_id] = (str(model).removeprefix("models/"), time.time(), time.perf_counter(), prompt,
+                               stages[-1] if stages else "other")
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        call = self._calls.pop(run_id, None)
+        if call is None:
+            return
+        model, started, clock, prompt, stage = call
+        usage = None
+        text = ""
+        for generations in response.generations:
+            for generation in generations:
+                text += generation.text
+                message = getattr(generation, "message", None)
+                usage = usage or getattr(message, "usage_metadata", None)
+        if usage:
+            record_llm_call(model, time.perf_counter() - clock, usage.get("input_tokens", 0),
+                            usage.get("output_tokens", 0), started, stage=stage)
+        else:
+            record_llm_call(model, time.perf_counter() - clock, count_tokens(prompt), count_tokens(text),
+                            started, estimated=True, stage=stage)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        call = self._calls.pop(run_id, None)
+        model = call[0] if call else "unknown"
+        incr("llm_errors", model=model)
+        if is_rate_limit_error(error):
+            incr("llm_throttled", model=model)
+
+
+class _RetryLogHandler(logging.Handler):
+    """
+    Counts the client's internal retries: langchain_google_genai retries with
+    tenacity and logs "Retrying ..." before each sleep, without any callback.
+    """
+
+    def emit(self, record):
+        message = record.getMessage()
+        if not message.startswith("Retrying"):
+            return
+        incr("llm_client_retries")
+        if re.search(r"\b429\b|ResourceExhausted|RESOURCE_EXHAUSTED", message):
+            incr("llm_client_throttled")
+
+
+_retry_handler = None
+_retry_handler_lock = threading.Lock()
+
+
+def install_retry_counter() -> None:
+    """Attaches the retry counter to the Gemini client's logger (once per process)."""
+    global _retry_handler
+    with _retry_handler_lock:
+        if _retry_handler is None:
+            _retry_handler = _RetryLogHandler(level=logging.WARNING)
+            logging.getLogger("langchain_google_genai.chat_models").addHandler(_retry_handler)
+
+
+class _MetricsRequestHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.rstrip("/") != "/metrics":
+            self.send_error(404)
+            return
+        body = render_prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # Scrapes every few seconds would flood the console
+
+
+def serve_metrics(port: int = None) -> ThreadingHTTPServer:
+    """Serves /metrics for Prometheus on a background thread (port from CRUXAI_METRICS_PORT)."""
+    port = port or int(os.getenv("CRUXAI_METRICS_PORT", "9464"))
+    server = ThreadingHTTPServer(("0.0.0.0", port), _MetricsRequestHandler)
+    threading.Thread(target=server.serve_forever, name="cruxai-metrics", daemon=True).start()
+    return server
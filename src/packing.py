@@ -0,0 +1,77 @@
+import os
+import re
+import json
+import uuid
+from src.chunking import count_tokens
+
+# A packed map request holds up to PACK_MAX_CHUNKS chunks and about PACK_TOKEN_BUDGET
+# prompt tokens. The chunk count also bounds the answer: one summary per chunk.
+PACK_TOKEN_BUDGET = int(os.getenv("CRUXAI_PACK_TOKENS", "200000"))
+PACK_MAX_CHUNKS = int(os.getenv("CRUXAI_PACK_MAX_CHUNKS", "16"))
+
+# Sections look like "<<<CHUNK 3 9f2c41ab>>> ... <<<END 3 9f2c41ab>>>". The random
+# tag differs per request, so chunk text can't accidentally close its section.
+SECTION_PATTERN = re.compile(r"<<<CHUNK (\S+) (\w+)>>>\n(.*?)\n<<<END \1 \2>>>", re.DOTALL)
+
+_CODE_FENCE = re.compile(r"^```(?:json)?\s*|\s*```$")
+# One complete "id": "summary" pair, for salvaging answers that were cut off mid-JSON
+_JSON_PAIR = re.compile(r'"([^"\\]+)"\s*:\s*("(?:[^"\\]|\\.)*")')
+
+
+def pack_chunks(texts: list, token_budget: int = PACK_TOKEN_BUDGET, max_chunks: int = PACK_MAX_CHUNKS,
+                allowance: int = 0) -> list:
+    """
+    Groups consecutive texts into packs that each fit in 'token_budget' tokens and
+    'max_chunks' texts, and returns the packs as lists of indexes into 'texts'.
+    Each text counts as its tokens plus 'allowance' (e.g. for its summary).
+    A text larger than the budget gets a pack of its own.
+    """
+    packs, current, used = [], [], 0
+    for index, text in enumerate(texts):
+        tokens = count_tokens(text) + allowance
+        if current and (used + tokens > token_budget or len(current) >= max_chunks):
+            packs.append(current)
+            current, used = [], 0
+        current.append(index)
+        used += tokens
+    if current:
+        packs.append(current)
+    return packs
+
+
+def format_sections(chunks: dict) -> str:
+    """Formats {chunk id: text} as delimited sections for a packed prompt."""
+    tag = uuid.uuid4().hex[:8]
+    return "\n\n".join(f"<<<CHUNK {chunk_id} {tag}>>>\n{text}\n<<<END {chunk_id} {tag}>>>"
+                       for chunk_id, text in chunks.items())
+
+
+def parse_summaries(answer: str, chunk_ids: list) -> dict:
+    """
+    Validates a packed answer, a JSON object of {chunk id: summary}, and returns
+    the usable summaries for 'chunk_ids'. Unknown ids, non-string and blank
+    summaries are dropped. If the JSON is invalid (e.g. the answer hit the
+    output limit), every complete pair before the break is still recovered.
+    The caller re-requests whatever ids are missing from the result.
+    """
+    text = _CODE_FENCE.sub("", answer.strip())
+    # An object, or a list of {"id": ..., "summary": ...} objects, which models sometimes prefer
+    opener = "[" if 0 <= text.find("[") < text.find("{") else "{"
+    start, end = text.find(opener), text.rfind("]" if opener == "[" else "}")
+    try:
+        parsed = json.loads(text[start:end + 1]) if start != -1 else None
+    except ValueError:
+        parsed = None
+    if isinstance(parsed, list):
+        parsed = {str(item.get("id")): item.get("summary") for item in parsed if isinstance(item, dict)}
+    if not isinstance(parsed, dict):
+        parsed = {}
+        for key, value in _JSON_PAIR.findall(text):
+            try:
+                parsed[key] = json.loads(value)
+            except ValueError:
+                continue
+
+    wanted = {str(chunk_id) for chunk_id in chunk_ids}
+    return {str(key): value.strip() for key, value in parsed.items()
+            if str(key) in wanted and isinstance(value, str) and value.strip()}
@@ -0,0 +1,62 @@
+import logging
+
+logger = logging.getLogger("cruxai")
+
+_LEVELS = {"info": logging.INFO, "warning": logging.WARNING, "error": logging.ERROR}
+
+
+class SummaryCancelled(Exception):
+    """Raised inside the pipeline when the caller has asked for the work to stop."""
+
+
+class ProgressReporter:
+    """
+    Routes progress messages from the summarizer to a callback, so the pipeline
+    doesn't depend on Streamlit. 'on_progress' is called as on_progress(level,
+    message) with level "info", "warning" or "error"; without one, messages go
+    to the "cruxai" logger.
+    Subclasses can also track structured progress (step), receive the final
+    summary as it streams in (token) and stop the pipeline between LLM calls
+    (check_cancelled); the base class ignores all three.
+    When a summarize function returns, 'complete' tells whether the text it
+    returned is a full summary (True) or a failure or partial result (False).
+    """
+
+    def __init__(self, on_progress=None):
+        self.on_progress = on_progress
+        self.complete = None
+
+    def _emit(self, level: str, message: str) -> None:
+        if self.on_progress is not None:
+            self.on_progress(level, message)
+        else:
+            logger.log(_LEVELS[level], message)
+
+    def info(self, message: str) -> None:
+        self._emit("info", message)
+
+    def warning(self, message: str) -> None:
+        self._emit("warning", message)
+
+    def error(self, message: str) -> None:
+        self._emit("error", message)
+
+    def step(self, stage: str, done: int, total: int = None) -> None:
+        """Structured progress: 'done' of 'total' units finished in 'stage' ("map", "reduce")."""
+
+    def token(self, text: str) -> None:
+        """A piece of the final summary, as it arrives from the LLM."""
+
+    def check_cancelled(self) -> None:
+        """Raises SummaryCancelled if the work should stop."""
+
+    def finished(self, complete: bool) -> None:
+        """Called once with whether the returned summary is complete."""
+        self.complete = complete
+
+
+def as_reporter(on_progress) -> ProgressReporter:
+    """Accepts either a ProgressReporter or an on_progress(level, message) callable."""
+    if isinstance(on_progress, ProgressReporter):
+        return on_progress
+    return ProgressReporter(on_progress)
@@ -0,0 +1,123 @@
+import re
+import time
+import random
+import asyncio
+import threading
+
+try:
+    from google.api_core.exceptions import ResourceExhausted
+except ImportError:  # google-api-core comes with google-generativeai, but don't require it here
+    ResourceExhausted = None
+
+
+# A 429 status line or the gRPC status name; a bare "429" could be any number in the message
+_RATE_LIMIT_MESSAGE = re.compile(
+    r"\bRESOURCE_EXHAUSTED\b|\b429\b\s*(?:Too Many Requests|Resource has been exhausted)", re.IGNORECASE)
+
+
+def is_rate_limit_error(exc: BaseException) -> bool:
+    """
+    Returns True if 'exc', or an exception it was raised from, is an HTTP 429 /
+    quota-exhausted error: a ResourceExhausted, a 429 status code attribute, or
+    a message carrying the RESOURCE_EXHAUSTED status or a 429 status line.
+    """
+    seen = set()
+    while exc is not None and id(exc) not in seen:
+        seen.add(id(exc))
+        if ResourceExhausted is not None and isinstance(exc, ResourceExhausted):
+            return True
+        code = getattr(exc, "status_code", None) or getattr(exc, "code", None)
+        if code == 429 or getattr(code, "value", None) == 429:
+            return True
+        if _RATE_LIMIT_MESSAGE.search(str(exc)):
+            return True
+        exc = exc.__cause__ or exc.__context__
+    return False
+
+
+def backoff_delay(attempt: int, base: float = 2.0, cap: float = 60.0) -> float:
+    """Exponential backoff with full jitter for the given (0-based) retry attempt."""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+class TokenBucket:
+    """
+    Async token bucket that refills continuously at 'rate_per_minute'.
+    'capacity' is the largest burst allowed and defaults to one minute's worth.
+    The state is guarded by a thread lock rather than an asyncio one, so a single
+    bucket can be shared by every event loop (and Streamlit session) in the process.
+    """
+
+    def __init__(self, rate_per_minute: float, capacity: float = None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity if capacity is not None else rate_per_minute
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    async def acquire(self, amount: float = 1) -> None:
+        """Waits until 'amount' tokens are available and takes them."""
+        amount = min(amount, self.capacity)  # A single oversized request must still be able to run
+        while True:
+            with self._lock:
+                self._refill()
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                wait = (amount - self.tokens) / self.rate
+            await asyncio.sleep(wait)
+
+
+class RateLimiter:
+    """Enforces both a requests-per-minute and a tokens-per-minute quota."""
+
+    def __init__(self, requests_per_minute: float, tokens_per_minute: float):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+
+    async def acquire(self, tokens: int) -> None:
+        await self.requests.acquire(1)
+        await self.tokens.acquire(tokens)
+
+
+class AdaptiveConcurrency:
+    """
+    Async concurrency limit that adapts with AIMD: the limit grows by one after a
+    full window of successful calls and is halved whenever a call is throttled.
+    Use as 'async with concurrency:' around each call.
+    """
+
+    def __init__(self, initial: int = 2, minimum: int = 1, maximum: int = 16):
+        self.minimum = minimum
+        self.maximum = max(maximum, minimum)
+        self.limit = min(max(initial, minimum), self.maximum)
+        self.in_flight = 0
+        self._successes = 0
+        self._condition = asyncio.Condition()
+
+    async def __aenter__(self):
+        async with self._condition:
+            await self._condition.wait_for(lambda: self.in_flight < self.limit)
+            self.in_flight += 1
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        async with self._condition:
+            self.in_flight -= 1
+            self._condition.notify_all()
+        return False
+
+    def record_success(self) -> None:
+        self._successes += 1
+        if self._successes >= self.limit:
+            self.limit = min(self.maximum, self.limit + 1)
+            self._successes = 0
+
+    def record_throttle(self) -> None:
+        self.limit = max(self.minimum, self.limit // 2)
+        self._successes = 0
@@ -1,157 +1,1058 @@
 import os
-import streamlit as st
+import re
+import json
+import time
+import queue
+import asyncio
+import threading
+import contextvars
 from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain_text_splitters import RecursiveCharacterTextSplitter
+from langchain_core.documents import Document
 from langchain_core.prompts import PromptTemplate
 from langchain_core.output_parsers import StrOutputParser
-from google.generativeai.types import HarmCategory, HarmBlockThreshold
+from langchain_core.runnables import RunnableParallel, RunnableLambda
+from src.cache import make_key, open_cache, open_tiered_cache
+from src.progress import ProgressReporter, SummaryCancelled, as_reporter
+from src.metrics import span, incr
+from src.llm import get_llm, run_async, model_for
+from src.extractive import select_sentences
+from src.dedup import NearDuplicateIndex, find_representatives
+from src.packing import pack_chunks, format_sections, parse_summaries, PACK_TOKEN_BUDGET
+from src.chunking import (iter_chunks, split_documents, make_splitter, chunk_stats, count_tokens,
+                          CHUNKING_MODE, CHUNK_TOKEN_TARGET)
+from src.rate_limiter import RateLimiter, AdaptiveConcurrency, is_rate_limit_error, backoff_delay
 
-# This is a helper function to initialize the LLM
-def _get_llm() -> ChatGoogleGenerativeAI:
+MAP_PROMPT_TEMPLATE = """
+    You are a helpful assistant who summarizes text.
+    Summarize the following text chunk concisely and clearly:
+    {text}
+    CONCISE SUMMARY:
     """
-    Initializes and returns the ChatGoogleGenerativeAI model.
-    Reads the API key from the environment.
+
+# Several chunks in one request, under tight request-per-minute quotas (map_mode="packed")
+PACKED_MAP_PROMPT_TEMPLATE = """
+    You are a helpful assistant who summarizes text.
+    Below are {count} text chunks. Each starts with a "<<<CHUNK id tag>>>" line and ends
+    with a "<<<END id tag>>>" line. Summarize each chunk on its own, concisely and clearly.
+    Answer with only a JSON object that maps every chunk id to its summary, like
+    {{"1": "summary of chunk 1", "2": "summary of chunk 2"}}.
+    {chunks}
+    JSON:
     """
-    api_key = os.getenv("GOOGLE_API_KEY")
-    if not api_key:
-        raise ValueError("GOOGLE_API_KEY not found in environment.")
 
-    # This prevents the model from returning a blank response due to safety filters
-    safety_settings = {
-        HarmCategory.HARM_CATEGORY_HARASSMENT: HarmBlockThreshold.BLOCK_NONE,
-        HarmCategory.HARM_CATEGORY_HATE_SPEECH: HarmBlockThreshold.BLOCK_NONE,
-        HarmCategory.HARM_CATEGORY_SEXUALLY_EXPLICIT: HarmBlockThreshold.BLOCK_NONE,
-        HarmCategory.HARM_CATEGORY_DANGEROUS_CONTENT: HarmBlockThreshold.BLOCK_NONE,
-    }
+REDUCE_PROMPT_TEMPLATE = """
+    You are an expert at synthesizing information.
+    Take the following collection of summaries and create one, final, cohesive summary
+    that covers all the main points.
+    COLLECTION OF SUMMARIES:
+    {summaries}
+    FINAL COHESIVE SUMMARY:
+    """
 
-    return ChatGoogleGenerativeAI(
-        model="gemini-2.5-pro",
-        google_api_key=api_key,
-        temperature=0.3,
-        max_retries=5,
-        safety_settings=safety_settings
-    )
+# How many LLM calls a batch step may have in flight at once
+MAX_CONCURRENCY = int(os.getenv("CRUXAI_MAX_CONCURRENCY", "2"))
 
-# --- 1. Main Summarization Function (LCEL MAP-REDUCE) ---
-def summarize_document(full_text: str) -> str:
+# Quota for the async map step; shared by every summarization in this process
+REQUESTS_PER_MINUTE = float(os.getenv("CRUXAI_RPM", "2"))
+TOKENS_PER_MINUTE = float(os.getenv("CRUXAI_TPM", "32000"))
+MAX_CONCURRENCY_CEILING = int(os.getenv("CRUXAI_MAX_CONCURRENCY_CEILING", "16"))
+MAP_MAX_ATTEMPTS = 6
+# Rounds of packed requests before chunks still missing from the answers are mapped one by one
+PACK_MAX_ROUNDS = 2
+# Tokens charged to the limiter per chunk on top of its text, for the summary that comes back
+SUMMARY_TOKEN_ALLOWANCE = 500
+# A pack must fit in one minute's token quota: the limiter caps larger requests at
+# its capacity instead of waiting, so they would go out over quota and get 429s
+PACK_REQUEST_TOKENS = int(min(PACK_TOKEN_BUDGET, TOKENS_PER_MINUTE))
+_rate_limiter = RateLimiter(REQUESTS_PER_MINUTE, TOKENS_PER_MINUTE)
+
+# Default map step: when requests per minute are the bottleneck, pack several chunks per
+# request, as long as a pack can hold at least two full-size chunks within PACK_REQUEST_TOKENS
+PACK_BELOW_RPM = 10
+PACK_FITS_TWO_CHUNKS = 2 * (CHUNK_TOKEN_TARGET + SUMMARY_TOKEN_ALLOWANCE + 1) <= PACK_REQUEST_TOKENS
+MAP_MODE = os.getenv("CRUXAI_MAP_MODE",
+                     "packed" if REQUESTS_PER_MINUTE <= PACK_BELOW_RPM and PACK_FITS_TWO_CHUNKS else "async")
+
+# Chunks the streaming map step holds at once (queued or in flight); the producer
+# waits beyond this, so memory stays bounded however large the input is
+MAX_PENDING_CHUNKS = int(os.getenv("CRUXAI_MAX_PENDING_CHUNKS", "32"))
+
+# Upper bound on the (estimated) tokens of summaries fed into a single reduce call
+REDUCE_TOKEN_BUDGET = int(os.getenv("CRUXAI_REDUCE_TOKEN_BUDGET", "60000"))
+
+# Re-run a map chunk on the reduce model when the fast model's answer looks empty or cut off
+MAP_ESCALATION = os.getenv("CRUXAI_MAP_ESCALATION", "1") == "1"
+# Gemini finish reasons meaning the answer stopped before the model was done
+_INCOMPLETE_FINISH_REASONS = {"MAX_TOKENS", "SAFETY", "RECITATION", "OTHER"}
+
+# Final summaries, shared by every process using the cache directory behind a per-process LRU
+SUMMARY_CACHE_TTL = float(os.getenv("CRUXAI_SUMMARY_CACHE_TTL", str(7 * 24 * 3600)))
+SUMMARY_CACHE_MAX_BYTES = int(os.getenv("CRUXAI_SUMMARY_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+SUMMARY_CACHE_MEMORY_BYTES = int(os.getenv("CRUXAI_SUMMARY_CACHE_MEMORY_BYTES", str(32 * 1024 * 1024)))
+_WHITESPACE = re.compile(r"\s+")
+
+# Append mode's per-document state (chunk boundaries, map and reduce results); see summarize_append
+DOCUMENT_STATE_TTL = float(os.getenv("CRUXAI_DOCUMENT_STATE_TTL", str(30 * 24 * 3600)))
+_document_locks = {}
+_document_locks_lock = threading.Lock()
+
+# This is a helper function to get the LLM
+def _get_llm(max_retries: int = 5, stage: str = "reduce") -> ChatGoogleGenerativeAI:
     """
-    Summarizes a large document using the Map-Reduce strategy,
-    built manually with LangChain Expression Language (LCEL).
+    Returns the shared client from src.llm for the model configured for 'stage',
+    which is created once per process and settings instead of on every call.
     """
-    llm = _get_llm()
-    
-    text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=8192,
-        chunk_overlap=200
-    )
-    docs = text_splitter.create_documents([full_text])
+    return get_llm(model_for(stage), max_retries=max_retries)
 
-    map_prompt_template = """
-    You are a helpful assistant who summarizes text.
-    Summarize the following text chunk concisely and clearly:
-    {text}
-    CONCISE SUMMARY:
+def _summary_cache():
+    return open_tiered_cache("summaries", memory_bytes=SUMMARY_CACHE_MEMORY_BYTES, max_entries=20_000,
+                             max_bytes=SUMMARY_CACHE_MAX_BYTES, ttl_seconds=SUMMARY_CACHE_TTL)
+
+def normalize_text(text: str) -> str:
+    """Collapses whitespace runs and trims, so re-wrapped or re-indented copies of a text compare equal."""
+    return _WHITESPACE.sub(" ", text).strip()
+
+def _pipeline_config(reduce_mode: str, chunking: str, dedup: bool, token_budget: int = None) -> str:
+    """
+    Every setting that changes a summary, as a JSON string. The map mode is left
+    out: packed requests ask the same of each chunk as single ones do.
+    """
+    return json.dumps({
+        "models": [model_for("map"), model_for("reduce")],
+        "prompts": [MAP_PROMPT_TEMPLATE, REDUCE_PROMPT_TEMPLATE],
+        "escalation": MAP_ESCALATION,
+        "reduce": [reduce_mode, REDUCE_TOKEN_BUDGET],
+        "chunking": [chunking, CHUNK_TOKEN_TARGET],
+        "dedup": dedup,
+        "token_budget": token_budget,
+    }, sort_keys=True)
+
+def _summary_cache_key(source: str, reduce_mode: str, chunking: str, dedup: bool, token_budget: int = None) -> str:
+    """Key of a final summary: the (normalized) input or a content hash of it, plus the pipeline settings."""
+    return make_key("summary", _pipeline_config(reduce_mode, chunking, dedup, token_budget), source)
+
+def _cached_summary(key: str, report: ProgressReporter):
+    """Returns the cached summary for 'key' (handing it to the reporter as the final text), or None."""
+    summary = _summary_cache().get(key)
+    if summary is not None:
+        report.info("Loaded the summary from the cache.")
+        report.token(summary)
+        report.finished(True)
+    return summary
+
+def _chunk_cache_key(doc) -> str:
+    return make_key(model_for("map"), MAP_PROMPT_TEMPLATE, doc.page_content)
+
+async def _ainvoke_limited(chain, value, tokens: int, concurrency: AdaptiveConcurrency, report: ProgressReporter,
+                           attrs: dict):
+    """
+    Runs 'chain.ainvoke(value)' paced by the shared RPM/TPM limiter. A throttled
+    call backs off and retries on its own; after MAP_MAX_ATTEMPTS throttled
+    attempts it gives up and returns None. The attempt count goes into 'attrs'.
+    """
+    for attempt in range(MAP_MAX_ATTEMPTS):
+        attrs["attempts"] = attempt + 1
+        report.check_cancelled()
+        await _rate_limiter.acquire(tokens)
+        report.check_cancelled()  # The limiter can wait a long time under a tight quota
+        async with concurrency:
+            try:
+                result = await chain.ainvoke(value)
+                concurrency.record_success()
+                return result
+            except Exception as e:
+                if not is_rate_limit_error(e):
+                    raise
+                concurrency.record_throttle()
+                incr("map_throttled")
+        incr("map_retries")
+        await asyncio.sleep(backoff_delay(attempt))
+    return None
+
+async def _amap_one(map_chain, doc, concurrency: AdaptiveConcurrency, report: ProgressReporter):
+    """
+    Runs the map chain on one doc with 'ainvoke' through _ainvoke_limited. A chunk
+    that is still throttled after MAP_MAX_ATTEMPTS comes back as None instead of
+    failing the job.
+    """
+    # Prompt tokens plus a rough allowance for the summary that comes back
+    tokens = _estimate_tokens(doc.page_content) + SUMMARY_TOKEN_ALLOWANCE
+    with span("map.chunk", tokens=tokens) as attrs:
+        summary = await _ainvoke_limited(map_chain, doc, tokens, concurrency, report, attrs)
+        if summary is None:
+            incr("map_skipped")
+        return summary
+
+async def _amap_pack(packed_chain, docs: list, indexes: list, concurrency: AdaptiveConcurrency,
+                     report: ProgressReporter) -> dict:
+    """
+    Summarizes the docs at 'indexes' with one packed request and returns the valid
+    summaries it contained as {index: summary}. Chunk ids in the prompt are the
+    indexes (1-based); a throttled-out or unparseable answer returns {}.
+    """
+    chunks = {str(i + 1): docs[i].page_content for i in indexes}
+    tokens = sum(_estimate_tokens(text) + SUMMARY_TOKEN_ALLOWANCE for text in chunks.values())
+    with span("map.pack", chunks=len(chunks), tokens=tokens) as attrs:
+        answer = await _ainvoke_limited(packed_chain, {"count": len(chunks), "chunks": format_sections(chunks)},
+                                        tokens, concurrency, report, attrs)
+        summaries = parse_summaries(answer or "", list(chunks))
+        attrs["found"] = len(summaries)
+    incr("map_packed_calls")
+    return {int(chunk_id) - 1: summary for chunk_id, summary in summaries.items()}
+
+async def _amap_packed(map_chain, docs: list, report: ProgressReporter, on_result=None) -> list:
+    """
+    Packed map step: consecutive chunks are bundled into requests of up to
+    PACK_MAX_CHUNKS chunks / PACK_TOKEN_BUDGET tokens, whose JSON answers are
+    validated and split back into one summary per chunk. Chunks missing from the
+    answers are packed again; after PACK_MAX_ROUNDS rounds the rest go through
+    the ordinary per-chunk map chain. Under an RPM-bound quota this turns 40
+    chunk calls into a handful of requests.
+    """
+    packed_chain = _build_packed_chain()
+    concurrency = AdaptiveConcurrency(MAX_CONCURRENCY, maximum=MAX_CONCURRENCY_CEILING)
+    summaries = [None] * len(docs)
+    pending = list(range(len(docs)))
+    for round_number in range(PACK_MAX_ROUNDS):
+        texts = [docs[i].page_content for i in pending]
+        packs = [[pending[i] for i in pack]
+                 for pack in pack_chunks(texts, PACK_REQUEST_TOKENS, allowance=SUMMARY_TOKEN_ALLOWANCE + 1)]
+        if round_number == 0:
+            report.info(f"Packing {len(docs)} chunks into {len(packs)} request(s)...")
+        for found in await asyncio.gather(*(_amap_pack(packed_chain, docs, pack, concurrency, report) for pack in packs)):
+            for index, summary in found.items():
+                summaries[index] = summary
+                if on_result:
+                    on_result(index, summary)
+        pending = [i for i in pending if summaries[i] is None]
+        if not pending:
+            return summaries
+        incr("map_pack_missing", len(pending))
+
+    report.info(f"{len(pending)} chunk(s) were missing from the packed answers; summarizing them one by one.")
+
+    def forward(position, summary):
+        if on_result:
+            on_result(pending[position], summary)
+
+    for index, summary in zip(pending, await _amap_chunks(map_chain, [docs[i] for i in pending], report, forward)):
+        summaries[index] = summary
+    return summaries
+
+async def _amap_chunks(map_chain, docs: list, report: ProgressReporter, on_result=None) -> list:
+    """
+    Maps every doc concurrently; concurrency grows on success and shrinks on 429s.
+    'on_result(index, summary)' is called as each chunk finishes.
+    """
+    concurrency = AdaptiveConcurrency(MAX_CONCURRENCY, maximum=MAX_CONCURRENCY_CEILING)
+
+    async def run(index, doc):
+        summary = await _amap_one(map_chain, doc, concurrency, report)
+        if on_result:
+            on_result(index, summary)
+        return summary
+
+    return await asyncio.gather(*(run(index, doc) for index, doc in enumerate(docs)))
+
+def _warn_skipped(summaries: list, report: ProgressReporter) -> None:
+    skipped = sum(1 for summary in summaries if summary is None)
+    if skipped:
+        report.warning(f"{skipped} chunk(s) were still rate limited after retries and were skipped.")
+
+def _run_map(map_chain, docs: list, map_mode: str, report: ProgressReporter, on_result=None) -> list:
+    """
+    Dispatches the map step to the async limiter-driven path, the packed path or
+    a plain batch call. 'on_result(index, summary)' is called per finished chunk,
+    or for every chunk once the whole batch is done.
+    """
+    report.check_cancelled()
+    if map_mode == "batch":
+        summaries = map_chain.batch(docs, {"max_concurrency": MAX_CONCURRENCY})
+        if on_result:
+            for index, summary in enumerate(summaries):
+                on_result(index, summary)
+        return summaries
+
+    if map_mode == "packed":
+        summaries = run_async(_amap_packed(map_chain, docs, report, on_result))
+    else:
+        summaries = run_async(_amap_chunks(map_chain, docs, report, on_result))
+    _warn_skipped(summaries, report)
+    return summaries
+
+# This runs the map step, only calling the LLM for chunks that aren't cached yet
+def _map_with_cache(map_chain, docs: list, use_cache: bool, map_mode: str, report: ProgressReporter) -> list:
+    """
+    Returns one summary per doc. Chunk summaries are stored in an on-disk cache
+    keyed on the chunk text, the map prompt and the model name, so re-summarizing
+    a revised or overlapping document only pays for the chunks that changed.
+    """
+    finished = 0
+
+    def count_finished(index, summary):
+        nonlocal finished
+        finished += 1
+        report.step("map", finished, len(docs))
+
+    if not use_cache:
+        report.info(f"Summarizing {len(docs)} chunks (Map step)...")
+        return _run_map(map_chain, docs, map_mode, report, on_result=count_finished)
+
+    cache = open_cache("chunk_summaries")
+    keys = [_chunk_cache_key(doc) for doc in docs]
+    cached = cache.get_many(keys)
+    missing = [i for i, key in enumerate(keys) if key not in cached]
+    incr("map_cache_hits", len(docs) - len(missing))
+
+    report.info(f"Summarizing {len(docs)} chunks (Map step, {len(docs) - len(missing)} cached)...")
+    finished = len(docs) - len(missing)
+    report.step("map", finished, len(docs))
+    if missing:
+        def checkpoint(index, summary):
+            # Store each chunk as soon as it's done, so an interrupted run resumes from here
+            if summary and summary.strip():  # Don't cache blank responses
+                cache.set(keys[missing[index]], summary)
+            count_finished(index, summary)
+
+        fresh = _run_map(map_chain, [docs[i] for i in missing], map_mode, report, on_result=checkpoint)
+        # checkpoint already stored each chunk
+        for i, summary in zip(missing, fresh):
+            cached[keys[i]] = summary
+
+    return [cached[key] for key in keys]
+
+def _map_step(map_chain, docs: list, use_cache: bool, map_mode: str, dedup: bool,
+              report: ProgressReporter) -> list:
+    """
+    Returns one summary per doc. With 'dedup', near-duplicate chunks (repeated
+    headers, disclaimers, page templates) are found with MinHash/LSH and only
+    one representative per cluster is summarized; the rest reuse its summary.
+    """
+    if not dedup:
+        return _map_with_cache(map_chain, docs, use_cache, map_mode, report)
+
+    with span("dedup", chunks=len(docs)):
+        representatives = find_representatives([doc.page_content for doc in docs])
+    unique = sorted(set(representatives))
+    saved = len(docs) - len(unique)
+    incr("dedup_saved_calls", saved)
+    if saved:
+        report.info(f"Found {saved} near-duplicate chunk(s); reusing their summaries saves {saved} LLM call(s).")
+
+    summaries = dict(zip(unique, _map_with_cache(map_chain, [docs[i] for i in unique], use_cache, map_mode, report)))
+    return [summaries[representative] for representative in representatives]
+
+# Marks the end of the producer's output in _amap_stream
+_END_OF_STREAM = object()
+
+async def _amap_stream(map_chain, docs, report: ProgressReporter, use_cache: bool = True, dedup: bool = True) -> tuple:
+    """
+    Producer/consumer map step. A worker thread pulls docs from the (blocking)
+    'docs' iterator and hands them to the event loop, which starts each chunk's
+    map call as soon as it arrives. With 'dedup', the producer also checks each
+    chunk against the earlier ones and near-duplicates reuse their representative's
+    call. Returns (summaries in chunk order, number of LLM calls saved by dedup).
+    """
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue()
+    cache = open_cache("chunk_summaries") if use_cache else None
+    concurrency = AdaptiveConcurrency(MAX_CONCURRENCY, maximum=MAX_CONCURRENCY_CEILING)
+    stopped = threading.Event()  # Tells the producer to stop early if the map step fails
+    pending = threading.BoundedSemaphore(MAX_PENDING_CHUNKS)
+    index = NearDuplicateIndex() if dedup else None
+
+    def produce():
+        try:
+            for doc in docs:
+                # Backpressure: don't read further ahead than the map step can absorb
+                while not pending.acquire(timeout=0.5):
+                    if stopped.is_set():
+                        return
+                if stopped.is_set():
+                    return
+                # MinHash is CPU work, so it runs here rather than on the event loop
+                representative = index.add(doc.page_content) if index else None
+                loop.call_soon_threadsafe(queue.put_nowait, (doc, representative))
+        except Exception as e:
+            loop.call_soon_threadsafe(queue.put_nowait, e)
+        finally:
+            if not stopped.is_set():
+                loop.call_soon_threadsafe(queue.put_nowait, _END_OF_STREAM)
+
+    finished = 0
+
+    async def map_one(doc):
+        nonlocal finished
+        try:
+            summary = cache.get(_chunk_cache_key(doc)) if cache else None
+            if summary is not None:
+                incr("map_cache_hits")
+            else:
+                summary = await _amap_one(map_chain, doc, concurrency, report)
+                if cache and summary and summary.strip():
+                    cache.set(_chunk_cache_key(doc), summary)
+        finally:
+            pending.release()
+        finished += 1
+        # The total keeps growing while the document is still being extracted
+        report.step("map", finished, len(tasks))
+        return summary
+
+    # The producer thread records into the same metrics trace as the caller
+    producer = loop.run_in_executor(None, contextvars.copy_context().run, produce)
+    tasks = []
+    try:
+        while True:
+            item = await queue.get()
+            if item is _END_OF_STREAM:
+                break
+            if isinstance(item, Exception):
+                raise item
+            doc, representative = item
+            if representative is None:
+                tasks.append(asyncio.create_task(map_one(doc)))
+            else:
+                pending.release()  # Reuses its representative's call, nothing to hold
+                tasks.append(tasks[representative])
+        await producer
+        summaries = await asyncio.gather(*tasks)
+        incr("chunks", len(tasks))
+        incr("dedup_saved_calls", len(tasks) - len(set(tasks)))
+        return summaries, len(tasks) - len(set(tasks))
+    except BaseException:
+        stopped.set()
+        for task in tasks:
+            task.cancel()
+        raise
+
+class TokenStream:
+    """
+    Iterates over an LLM response's text pieces as they arrive and times them:
+    'ttft' is the seconds until the first non-empty piece, 'seconds' until the
+    end, and 'text' holds everything received so far. With prefetch=True the
+    response is consumed on a background thread right away, so several streams
+    run concurrently while they are displayed one after another.
+    """
+
+    def __init__(self, pieces, prefetch: bool = False, cached: bool = False):
+        self.cached = cached
+        self.started = time.perf_counter()
+        self.ttft = None
+        self.seconds = None
+        self._parts = []
+        self._pieces = self._timed(pieces)
+        self._queue = None
+        if prefetch:
+            self._queue = queue.Queue()
+            context = contextvars.copy_context()  # Keep recording into the caller's metrics trace
+            threading.Thread(target=context.run, args=(self._drain,), daemon=True).start()
+
+    def _timed(self, pieces):
+        for piece in pieces:
+            if piece and self.ttft is None:
+                self.ttft = time.perf_counter() - self.started
+            yield piece
+        self.seconds = time.perf_counter() - self.started
+
+    def _drain(self) -> None:
+        try:
+            for piece in self._pieces:
+                self._queue.put(piece)
+            self._queue.put(_END_OF_STREAM)
+        except Exception as e:
+            self._queue.put(e)  # Re-raised on the consumer's side
+
+    def __iter__(self):
+        while True:
+            if self._queue is None:
+                piece = next(self._pieces, _END_OF_STREAM)
+            else:
+                piece = self._queue.get()
+            if piece is _END_OF_STREAM:
+                return
+            if isinstance(piece, Exception):
+                raise piece
+            self._parts.append(piece)
+            yield piece
+
+    @property
+    def text(self) -> str:
+        return "".join(self._parts)
+
+def _stream_final(reduce_chain, text: str, report: ProgressReporter) -> str:
+    """
+    Runs the last reduce call with streaming: the summary's text goes to
+    report.token as it arrives, and the time to first token is reported.
+    """
+    tokens = _estimate_tokens(text)
+    with span("reduce.final", tokens=tokens) as attrs:
+        # Wait for quota like every other call; the map step may just have used it up
+        run_async(_rate_limiter.acquire(tokens + SUMMARY_TOKEN_ALLOWANCE))
+        report.check_cancelled()
+        stream = TokenStream(reduce_chain.stream(text))
+        for piece in stream:
+            report.token(piece)
+            report.check_cancelled()
+        attrs["ttft"] = stream.ttft
+    if stream.ttft is not None:
+        report.info(f"Final summary: first token after {stream.ttft:.1f}s, complete after {stream.seconds:.1f}s.")
+    return stream.text
+
+def _estimate_tokens(text: str) -> int:
+    """Local token estimate, used for rate limiting and reduce budgeting."""
+    return count_tokens(text) + 1
+
+def _group_by_budget(summaries: list, token_budget: int) -> list:
+    """Packs consecutive summaries into groups that each fit in 'token_budget'."""
+    groups, current, used = [], [], 0
+    for summary in summaries:
+        tokens = _estimate_tokens(summary)
+        if current and used + tokens > token_budget:
+            groups.append(current)
+            current, used = [], 0
+        current.append(summary)
+        used += tokens
+    if current:
+        groups.append(current)
+
+    # Every summary is too big to share a call; pair them up so each level still shrinks
+    if len(summaries) > 1 and len(groups) == len(summaries):
+        groups = [summaries[i:i + 2] for i in range(0, len(summaries), 2)]
+    return groups
+
+async def _areduce_groups(reduce_chain, inputs: list, report: ProgressReporter) -> list:
+    """
+    Reduces the group texts of one tree level concurrently through _ainvoke_limited,
+    so they share the RPM/TPM limiter with the map step. A group still throttled
+    after MAP_MAX_ATTEMPTS comes back as None.
+    """
+    concurrency = AdaptiveConcurrency(MAX_CONCURRENCY, maximum=MAX_CONCURRENCY_CEILING)
+
+    async def run(text):
+        tokens = _estimate_tokens(text) + SUMMARY_TOKEN_ALLOWANCE
+        with span("reduce.group", tokens=tokens) as attrs:
+            return await _ainvoke_limited(reduce_chain, text, tokens, concurrency, report, attrs)
+
+    return await asyncio.gather(*(run(text) for text in inputs))
+
+def _tree_reduce(reduce_chain, summaries: list, report: ProgressReporter, token_budget: int = REDUCE_TOKEN_BUDGET,
+                 memo: dict = None) -> tuple:
     """
-    map_prompt = PromptTemplate.from_template(map_prompt_template)
+    Reduces summaries level by level: each level packs the current summaries into
+    token-bounded groups and reduces the groups in parallel, until one group is left.
+    Every call goes through the shared rate limiter (see _areduce_groups).
+    Returns (final_summary, stats) where stats holds the depth, per-level fan-out
+    and how many group reductions were reused.
+    'memo' maps a hash of a group's input to its reduced summary. Groups found in
+    it aren't reduced again, and it is updated to hold exactly this run's groups.
+    Groups are packed left to right, so when summaries are only appended, every
+    group but the last on each level is unchanged and comes from the memo.
+    """
+    level = summaries
+    fan_out = []
+    used, reused = {}, 0
+
+    def finish(final_summary):
+        if memo is not None:
+            memo.clear()
+            memo.update(used)
+        return final_summary, {"depth": len(fan_out), "fan_out": fan_out, "reused": reused}
+
+    while True:
+        report.check_cancelled()
+        groups = _group_by_budget(level, token_budget)
+        fan_out.append(len(groups))
+        report.step("reduce", len(fan_out))
+        if len(groups) == 1:
+            return finish(_stream_final(reduce_chain, "\n\n".join(groups[0]), report))
+
+        report.info(f"Reduce level {len(fan_out)}: combining {len(level)} summaries in {len(groups)} groups...")
+        inputs = ["\n\n".join(group) for group in groups]
+        keys = [make_key(input_text) for input_text in inputs]
+        known = memo or {}
+        todo = [i for i, key in enumerate(keys) if key not in known]
+        reused += len(groups) - len(todo)
+        with span("reduce.level", level=len(fan_out), inputs=len(level), groups=len(groups), reused=len(groups) - len(todo)):
+            fresh = run_async(_areduce_groups(reduce_chain, [inputs[i] for i in todo], report)) if todo else []
+        skipped = sum(1 for summary in fresh if summary is None)
+        if skipped:
+            report.warning(f"{skipped} reduce group(s) were still rate limited after retries and were skipped.")
+        reduced = [known.get(key) for key in keys]
+        for i, summary in zip(todo, fresh):
+            reduced[i] = summary
+        used.update((key, summary) for key, summary in zip(keys, reduced) if summary and summary.strip())
+        level = [summary for summary in reduced if summary and summary.strip()]
+        if not level:
+            return finish("")
+
+def _looks_incomplete(message) -> bool:
+    """True if a map answer is empty or the model stopped early (token limit, safety filter)."""
+    finish_reason = str((message.response_metadata or {}).get("finish_reason", "")).upper()
+    return not str(message.content).strip() or finish_reason.split(".")[-1] in _INCOMPLETE_FINISH_REASONS
+
+def _escalating(fast_chain, strong_chain):
+    """
+    Wraps a fast map chain (input -> message) so that an answer that looks empty
+    or truncated is replaced by the strong chain's (input -> str) answer.
+    """
+    def run(doc):
+        message = fast_chain.invoke(doc)
+        if _looks_incomplete(message):
+            incr("map_escalations")
+            return strong_chain.invoke(doc)
+        return message.content
+
+    async def arun(doc):
+        message = await fast_chain.ainvoke(doc)
+        if _looks_incomplete(message):
+            incr("map_escalations")
+            return await strong_chain.ainvoke(doc)
+        return message.content
+
+    return RunnableLambda(run, afunc=arun)
+
+def _build_chains(map_mode: str = "async") -> tuple:
+    """
+    Returns the (map_chain, reduce_chain) pair used by the summarization functions.
+    Map calls go to the "map" stage model and reduce calls to the "reduce" one;
+    see src.llm.STAGE_MODELS.
+    """
+    llm = _get_llm(stage="reduce")
+    # The async map paths do their own 429 backoff, so don't stack client retries on top
+    map_retries = 1 if map_mode in ("async", "packed") else 5
+    map_llm = _get_llm(max_retries=map_retries, stage="map")
+
+    map_prompt = PromptTemplate.from_template(MAP_PROMPT_TEMPLATE)
     
     map_chain = (
         {"text": lambda doc: doc.page_content} 
         | map_prompt 
-        | llm 
+        | map_llm 
         | StrOutputParser()
     )
+    if MAP_ESCALATION and model_for("map") != model_for("reduce"):
+        fast_chain = {"text": lambda doc: doc.page_content} | map_prompt | map_llm
+        strong_chain = (
+            {"text": lambda doc: doc.page_content}
+            | map_prompt
+            | _get_llm(max_retries=map_retries, stage="reduce")
+            | StrOutputParser()
+        ).with_config(tags=["stage:map-escalation"])
+        map_chain = _escalating(fast_chain, strong_chain)
+    map_chain = map_chain.with_config(tags=["stage:map"])
 
-    try:
-        st.info(f"Summarizing {len(docs)} chunks (Map step)...")
-        list_of_summaries = map_chain.batch(docs, {"max_concurrency": 2})
-        if not list_of_summaries:
-            st.warning("No summaries generated during map step.")
-            return "No summary generated due to empty results."
-    except Exception as e:
-        st.error(f"Error during 'Map' step: {e}")
-        if "429" in str(e):
-            st.error("Hit Google API rate limit (2 calls/min). Please wait a minute and try again.")
-        return f"Summary generation failed during the map step: {str(e)}"
-
-    combined_summaries = "\n\n".join(list_of_summaries)
-
-    reduce_prompt_template = """
-    You are an expert at synthesizing information.
-    Take the following collection of summaries and create one, final, cohesive summary
-    that covers all the main points.
-    COLLECTION OF SUMMARIES:
-    {summaries}
-    FINAL COHESIVE SUMMARY:
-    """
-    reduce_prompt = PromptTemplate.from_template(reduce_prompt_template)
+    reduce_prompt = PromptTemplate.from_template(REDUCE_PROMPT_TEMPLATE)
     
     reduce_chain = (
         {"summaries": lambda x: x}
         | reduce_prompt 
         | llm 
         | StrOutputParser()
-    )
+    ).with_config(tags=["stage:reduce"])
+    return map_chain, reduce_chain
 
+def _build_packed_chain():
+    """
+    The map chain of the packed path: {"count", "chunks"} -> the model's raw (JSON)
+    answer. Like the per-chunk chain, an empty or cut-off answer is re-run on the
+    "reduce" stage model when MAP_ESCALATION is on.
+    """
+    packed_prompt = PromptTemplate.from_template(PACKED_MAP_PROMPT_TEMPLATE)
+    fast_chain = packed_prompt | _get_llm(max_retries=1, stage="map")
+    if MAP_ESCALATION and model_for("map") != model_for("reduce"):
+        strong_chain = (
+            packed_prompt
+            | _get_llm(max_retries=1, stage="reduce")
+            | StrOutputParser()
+        ).with_config(tags=["stage:map-escalation"])
+        packed_chain = _escalating(fast_chain, strong_chain)
+    else:
+        packed_chain = fast_chain | StrOutputParser()
+    return packed_chain.with_config(tags=["stage:map"])
+
+def _step_failed(step: str, error: Exception, report: ProgressReporter) -> tuple:
+    """Reports an error in the map or reduce step and returns the (message, False) result."""
+    report.error(f"Error during '{step.title()}' step: {error}")
+    if is_rate_limit_error(error):
+        report.error(f"Hit Google API rate limit ({REQUESTS_PER_MINUTE:g} calls/min). "
+                     "Please wait a minute and try again.")
+    return f"Summary generation failed during the {step} step: {error}", False
+
+def _reduce_step(reduce_chain, list_of_summaries: list, reduce_mode: str, report: ProgressReporter,
+                 memo: dict = None) -> tuple:
+    """
+    Runs the reduce step over the map summaries. Returns (final summary or an
+    error message, whether it succeeded). 'memo' is passed on to _tree_reduce.
+    """
     try:
-        st.info("Creating final summary (Reduce step)...")
-        final_summary = reduce_chain.invoke(combined_summaries)
+        report.info("Creating final summary (Reduce step)...")
+        with span("reduce", mode=reduce_mode, inputs=len(list_of_summaries)):
+            if reduce_mode == "single":
+                final_summary = _stream_final(reduce_chain, "\n\n".join(list_of_summaries), report)
+            else:
+                final_summary, stats = _tree_reduce(reduce_chain, list_of_summaries, report, memo=memo)
+                report.info(f"Reduce finished: depth {stats['depth']}, fan-out per level {stats['fan_out']}"
+                            + (f", {stats['reused']} group(s) reused." if stats["reused"] else "."))
         if not final_summary or not final_summary.strip():
-            st.warning("Empty summary generated during reduce step.")
-            return "No valid summary generated."
-        return final_summary
+            report.warning("Empty summary generated during reduce step.")
+            return "No valid summary generated.", False
+        return final_summary, True
+    except SummaryCancelled:
+        raise
+    except Exception as e:
+        return _step_failed("reduce", e, report)
+
+def _report_chunks(docs: list, report: ProgressReporter) -> None:
+    stats = chunk_stats(docs)
+    report.info(f"Split into {stats['chunks']} chunks, ~{stats['total_tokens']:,} tokens "
+            f"(avg ~{stats['avg_tokens']:,}, max ~{stats['max_tokens']:,} per chunk).")
+
+# --- 1. Main Summarization Function (LCEL MAP-REDUCE) ---
+def summarize_document(full_text: str, use_cache: bool = True, reduce_mode: str = "tree",
+                       map_mode: str = MAP_MODE, chunking: str = CHUNKING_MODE, dedup: bool = True,
+                       token_budget: int = None, on_progress=None) -> str:
+    """
+    Summarizes a large document using the Map-Reduce strategy,
+    built manually with LangChain Expression Language (LCEL).
+    Set 'use_cache' to False to bypass the chunk summary and final summary caches;
+    the final summary cache is keyed on the whitespace-normalized text and the
+    settings, so an identical or re-wrapped document is only summarized once
+    across every app process sharing the cache directory.
+    'reduce_mode' is "tree" (multi-level, token-bounded reduce) or "single"
+    (one reduce call over every map summary).
+    'map_mode' is "async" (rate-limited, adaptive concurrency), "packed" (like
+    async, but several chunks per request, for tight request quotas) or "batch".
+    'chunking' is "tokens" (chunks packed up to a token target on sentence
+    boundaries, so far fewer map calls) or "chars" (fixed 8192-character chunks).
+    'dedup' summarizes only one chunk per cluster of near-duplicate chunks.
+    'token_budget' turns on budget mode: sentences are ranked locally (TF-IDF +
+    TextRank) and only the top ones, up to that many tokens, reach the LLM.
+    'on_progress' is an on_progress(level, message) callable or a ProgressReporter,
+    which also receives per-chunk progress, the final summary's tokens as they
+    stream in, whether the result is complete (see ProgressReporter.finished),
+    and can cancel the run.
+    """
+    report = as_reporter(on_progress)
+    key = _summary_cache_key(normalize_text(full_text), reduce_mode, chunking, dedup, token_budget) if use_cache else None
+    cached = _cached_summary(key, report) if key else None
+    if cached is not None:
+        return cached
+    summary, complete = _summarize_text(full_text, use_cache, reduce_mode, map_mode, chunking, dedup, token_budget, report)
+    if key and complete:
+        _summary_cache().set(key, summary)
+    report.finished(complete)
+    return summary
+
+def _summarize_text(full_text: str, use_cache: bool, reduce_mode: str, map_mode: str, chunking: str,
+                    dedup: bool, token_budget: int, report: ProgressReporter) -> tuple:
+    """The body of summarize_document; returns (summary or error message, whether it is complete)."""
+    map_chain, reduce_chain = _build_chains(map_mode)
+
+    if token_budget:
+        with span("budget", token_budget=token_budget):
+            full_text, stats = select_sentences(full_text, token_budget)
+        if stats["sentences_kept"] < stats["sentences_in"]:
+            report.info(f"Budget mode kept {stats['sentences_kept']:,} of {stats['sentences_in']:,} sentences "
+                    f"(~{stats['tokens_kept']:,} of ~{stats['tokens_in']:,} tokens).")
+    
+    with span("split", chars=len(full_text), mode=chunking):
+        docs = split_documents(full_text, chunking)
+    incr("chunks", len(docs))
+    _report_chunks(docs, report)
+
+    try:
+        with span("map", chunks=len(docs), mode=map_mode):
+            list_of_summaries = _map_step(map_chain, docs, use_cache, map_mode, dedup, report)
+        return _reduce_summaries(reduce_chain, list_of_summaries, reduce_mode, report)
+    except SummaryCancelled:
+        raise
+    except Exception as e:
+        return _step_failed("map", e, report)
+
+def _reduce_summaries(reduce_chain, list_of_summaries: list, reduce_mode: str, report: ProgressReporter,
+                      memo: dict = None) -> tuple:
+    """
+    Reduces the map summaries, of which skipped chunks are None. Returns (summary,
+    complete), where a summary missing skipped chunks doesn't count as complete.
+    """
+    skipped = any(summary is None for summary in list_of_summaries)
+    list_of_summaries = [summary for summary in list_of_summaries if summary is not None]
+    if not list_of_summaries:
+        report.warning("No summaries generated during map step.")
+        return "No summary generated due to empty results.", False
+    summary, complete = _reduce_step(reduce_chain, list_of_summaries, reduce_mode, report, memo)
+    return summary, complete and not skipped
+
+def summarize_stream(text_blocks, use_cache: bool = True, reduce_mode: str = "tree",
+                     chunking: str = CHUNKING_MODE, dedup: bool = True, on_progress=None,
+                     source_id: str = None) -> str:
+    """
+    Pipelined variant of summarize_document for text that is still being produced,
+    e.g. the page generator from data_loader.iter_pdf_text. Blocks are split
+    incrementally and each chunk's map call starts as soon as the chunk is complete,
+    so extraction overlaps with LLM latency.
+    The text isn't known up front, so the final summary is only cached when the
+    caller passes a 'source_id' identifying the content (e.g. a hash of the file).
+    """
+    report = as_reporter(on_progress)
+    key = _summary_cache_key(source_id, reduce_mode, chunking, dedup) if use_cache and source_id else None
+    cached = _cached_summary(key, report) if key else None
+    if cached is not None:
+        return cached
+    summary, complete = _summarize_blocks(text_blocks, use_cache, reduce_mode, chunking, dedup, report)
+    if key and complete:
+        _summary_cache().set(key, summary)
+    report.finished(complete)
+    return summary
+
+def _summarize_blocks(text_blocks, use_cache: bool, reduce_mode: str, chunking: str, dedup: bool,
+                      report: ProgressReporter) -> tuple:
+    """The body of summarize_stream; returns (summary or error message, whether it is complete)."""
+    map_chain, reduce_chain = _build_chains("async")
+
+    try:
+        report.info("Summarizing chunks as the document is extracted (Map step)...")
+        with span("map", mode="stream") as attrs:
+            list_of_summaries, saved = run_async(
+                _amap_stream(map_chain, iter_chunks(text_blocks, chunking), report, use_cache, dedup)
+            )
+            attrs["chunks"] = len(list_of_summaries)
+        if saved:
+            report.info(f"Found {saved} near-duplicate chunk(s); reusing their summaries saved {saved} LLM call(s).")
+        _warn_skipped(list_of_summaries, report)
+        report.info(f"Map step finished: {len(list_of_summaries)} chunk summaries.")
+        return _reduce_summaries(reduce_chain, list_of_summaries, reduce_mode, report)
+    except SummaryCancelled:
+        raise
     except Exception as e:
-        st.error(f"Error during 'Reduce' step: {e}")
-        if "429" in str(e):
-            st.error("Hit Google API rate limit (2 calls/min). Please wait a minute and try again.")
-        return f"Summary generation failed during the reduce step: {str(e)}"
+        return _step_failed("map", e, report)
+
+def _document_store():
+    return open_cache("documents", max_entries=10_000, max_bytes=512 * 1024 * 1024, ttl_seconds=DOCUMENT_STATE_TTL)
+
+def _document_lock(doc_id: str) -> threading.Lock:
+    with _document_locks_lock:
+        return _document_locks.setdefault(doc_id, threading.Lock())
+
+def _split_tail(tail: str, chunking: str) -> tuple:
+    """
+    Splits the part of a document after its last final chunk. Returns (chunks,
+    start offset in 'tail' of each chunk). Every chunk but the last is final:
+    appending more text can only change how the last one is split.
+    """
+    chunks = make_splitter(chunking).split_text(tail)
+    starts, position = [], 0
+    for chunk in chunks[:-1]:
+        position = max(tail.find(chunk, position), position)
+        starts.append(position)
+        position += 1
+    if chunks:
+        # The last chunk ends the text, so its rightmost occurrence is the real one
+        starts.append(tail.rfind(chunks[-1]))
+    return chunks, starts
+
+def summarize_append(doc_id: str, full_text: str, use_cache: bool = True, map_mode: str = MAP_MODE,
+                     chunking: str = CHUNKING_MODE, dedup: bool = True, on_progress=None) -> str:
+    """
+    Append mode for documents that grow between submissions, e.g. live meeting
+    transcripts or log exports. 'full_text' is the whole current document. The
+    state kept per 'doc_id' (chunk boundaries, map summaries and reduce results)
+    means only the chunks after the last final one are mapped and only the reduce
+    groups they feed are reduced again, so an update costs about as much as the
+    new text. If anything before the appended part changed, or the settings did,
+    the document is summarized from scratch. Always uses the tree reduce.
+    """
+    report = as_reporter(on_progress)
+    config = _pipeline_config("tree", chunking, dedup)
+    key = make_key("document", doc_id)
+    with _document_lock(doc_id):
+        stored = _document_store().get(key)
+        state = json.loads(stored) if stored else None
+        if state is not None and state["config"] == config and state["text_hash"] == make_key(full_text):
+            report.info("The document hasn't changed since its last summary.")
+            report.token(state["summary"])
+            report.finished(True)
+            return state["summary"]
+        if state is None or state["config"] != config or len(full_text) < state["committed"] \
+                or state["prefix_hash"] != make_key(full_text[:state["committed"]]):
+            if state is not None:
+                report.info("The document changed before its new text; summarizing it from scratch.")
+            state = {"config": config, "committed": 0, "boundaries": [], "summaries": [], "reduce": {}}
+
+        summary, complete = _summarize_appended(state, full_text, use_cache, map_mode, chunking, dedup, report)
+        if complete:
+            state.update(prefix_hash=make_key(full_text[:state["committed"]]), text_hash=make_key(full_text),
+                         summary=summary)
+            _document_store().set(key, json.dumps(state))
+        report.finished(complete)
+        return summary
+
+def _summarize_appended(state: dict, full_text: str, use_cache: bool, map_mode: str, chunking: str, dedup: bool,
+                        report: ProgressReporter) -> tuple:
+    """
+    The body of summarize_append: maps the chunks after state["committed"], then
+    reduces them with the stored summaries. Moves the state past the new final
+    chunks and returns (summary or error message, whether it is complete).
+    """
+    map_chain, reduce_chain = _build_chains(map_mode)
+    committed = state["committed"]
+    with span("split", chars=len(full_text) - committed, mode=chunking, append=True):
+        chunks, starts = _split_tail(full_text[committed:], chunking)
+    incr("chunks", len(chunks))
+    report.info(f"Append mode: {len(state['summaries'])} chunk(s) already summarized, "
+                f"{len(chunks)} new or still growing.")
+
+    try:
+        with span("map", chunks=len(chunks), mode=map_mode, append=True):
+            docs = [Document(page_content=chunk) for chunk in chunks]
+            new_summaries = _map_step(map_chain, docs, use_cache, map_mode, dedup, report) if docs else []
+        summary, complete = _reduce_summaries(reduce_chain, state["summaries"] + new_summaries, "tree", report,
+                                              state["reduce"])
+    except SummaryCancelled:
+        raise
+    except Exception as e:
+        return _step_failed("map", e, report)
+
+    if complete and chunks:
+        # The last chunk may still grow, so it is mapped again next time
+        state["boundaries"] += [committed + start for start in starts[:-1]]
+        state["summaries"] += new_summaries[:-1]
+        state["committed"] = committed + starts[-1]
+    return summary, complete
 
 # --- 2. Bonus Feature Functions ---
-def get_takeaways(summary: str) -> str:
-    llm = _get_llm()
-    prompt_template = """
+EXTRA_PROMPT_TEMPLATES = {
+    "takeaways": """
     You are an expert analyst. From the following text, extract the 5 most important key takeaways.
     Present them as a concise, bulleted list. TEXT: "{text}" KEY TAKEAWAYS:
-    """
-    prompt = PromptTemplate.from_template(prompt_template)
-    chain = prompt | llm | StrOutputParser()
-    return chain.invoke({"text": summary})
-
-def get_keywords(summary: str) -> str:
-    llm = _get_llm()
-    prompt_template = """
+    """,
+    "keywords": """
     You are an expert in text analysis. From the following text, extract:
     1. The 5 main topics
     2. The 10 most relevant keywords
     Present them as two separate lists. TEXT: "{text}" TOPICS & KEYWORDS:
-    """
-    prompt = PromptTemplate.from_template(prompt_template)
-    chain = prompt | llm | StrOutputParser()
-    return chain.invoke({"text": summary})
-
-def generate_social_post(summary: str) -> str:
-    llm = _get_llm()
-    prompt_template = """
+    """,
+    "linkedin": """
     You are a professional social media manager. Based on the following summary, write an engaging 
     and professional LinkedIn post. Include 3-5 relevant hashtags.
     SUMMARY: "{text}" LINKEDIN POST:
+    """,
+    "twitter": """
+    You are a professional social media manager. Based on the following summary, write a concise and engaging Twitter post . Include 2-3 relevant hashtags.
+    SUMMARY: "{text}" TWITTER POST:
+    """,
+}
+
+def _finish_extra(artifact: str, text: str) -> str:
+    """Applies per-artifact post-processing to a raw LLM response."""
+    # Ensure the Twitter post is within 280 characters
+    if artifact == "twitter" and len(text) > 280:
+        text = text[:277] + "..."
+    return text
+
+def _extra_keys(summary: str, artifacts: list) -> dict:
+    """Validates the artifact names and returns {artifact: cache key}."""
+    unknown = [artifact for artifact in artifacts if artifact not in EXTRA_PROMPT_TEMPLATES]
+    if unknown:
+        raise ValueError(f"Unknown artifact(s): {', '.join(unknown)}")
+    return {artifact: make_key(model_for("extras"), EXTRA_PROMPT_TEMPLATES[artifact], summary) for artifact in artifacts}
+
+def generate_extras(summary: str, artifacts: list) -> dict:
     """
-    prompt = PromptTemplate.from_template(prompt_template)
-    chain = prompt | llm | StrOutputParser()
-    return chain.invoke({"text": summary})
+    Generates the requested bonus artifacts (keys of EXTRA_PROMPT_TEMPLATES) for
+    a summary and returns {artifact: text}. Artifacts that aren't cached yet are
+    generated concurrently with one RunnableParallel call, and every result is
+    memoized on disk per (summary hash, artifact prompt, model), so repeat requests
+    don't call the LLM at all.
+    """
+    keys = _extra_keys(summary, artifacts)
+    cache = open_cache("extras")
+    cached = cache.get_many(list(keys.values()))
+    results = {artifact: cached[key] for artifact, key in keys.items() if key in cached}
+
+    missing = [artifact for artifact in artifacts if artifact not in results]
+    incr("extras_cache_hits", len(results))
+    if missing:
+        llm = _get_llm(stage="extras")
+        branches = {
+            artifact: PromptTemplate.from_template(EXTRA_PROMPT_TEMPLATES[artifact]) | llm | StrOutputParser()
+            for artifact in missing
+        }
+        with span("extras", artifacts=",".join(missing)):
+            fresh = RunnableParallel(branches).invoke({"text": summary}, {"tags": ["stage:extras"]})
+        new_entries = {}
+        for artifact in missing:
+            results[artifact] = _finish_extra(artifact, fresh[artifact])
+            if results[artifact] and results[artifact].strip():  # Don't cache blank responses
+                new_entries[keys[artifact]] = results[artifact]
+        cache.set_many(new_entries)
+
+    return {artifact: results[artifact] for artifact in artifacts}
+
+def _truncate_stream(pieces, limit: int):
+    """Streaming version of the Twitter cut in _finish_extra: over 'limit' chars ends in '...'."""
+    emitted, held = 0, ""
+    for piece in pieces:
+        if held or emitted + len(piece) > limit - 3:
+            held += piece  # Might still fit if the response ends within 'limit'
+            continue
+        emitted += len(piece)
+        yield piece
+    if held:
+        yield held if emitted + len(held) <= limit else held[:limit - 3 - emitted] + "..."
+
+def _stream_extra(artifact: str, summary: str, key: str):
+    """Yields one artifact's text as the LLM produces it, then caches the whole response."""
+    chain = PromptTemplate.from_template(EXTRA_PROMPT_TEMPLATES[artifact]) | _get_llm(stage="extras") | StrOutputParser()
+    pieces = chain.stream({"text": summary}, {"tags": ["stage:extras"]})
+    if artifact == "twitter":
+        pieces = _truncate_stream(pieces, 280)
+    parts = []
+    for piece in pieces:
+        parts.append(piece)
+        yield piece
+    text = "".join(parts)
+    if text.strip():  # Don't cache blank responses
+        open_cache("extras").set(key, text)
+
+def stream_extras(summary: str, artifacts: list) -> dict:
+    """
+    Streaming counterpart of generate_extras: returns {artifact: TokenStream}.
+    Every uncached artifact starts generating immediately and concurrently, so
+    the first one can be displayed token by token while the rest are still being
+    written. Cached artifacts come back as a single piece.
+    """
+    keys = _extra_keys(summary, artifacts)
+    cached = open_cache("extras").get_many(list(keys.values()))
+    return {
+        artifact: TokenStream([cached[key]], cached=True) if key in cached
+        else TokenStream(_stream_extra(artifact, summary, key), prefetch=True)
+        for artifact, key in keys.items()
+    }
+
+def get_takeaways(summary: str) -> str:
+    return generate_extras(summary, ["takeaways"])["takeaways"]
+
+def get_keywords(summary: str) -> str:
+    return generate_extras(summary, ["keywords"])["keywords"]
+
+def generate_social_post(summary: str) -> str:
+    return generate_extras(summary, ["linkedin"])["linkedin"]
 
 def generate_twitter_post(summary: str) -> str:
     """
     Generates a concise Twitter post in short based on the summary, including 2-3 hashtags.
     """
-    llm = _get_llm()
-    prompt_template = """
-    You are a professional social media manager. Based on the following summary, write a concise and engaging Twitter post . Include 2-3 relevant hashtags.
-    SUMMARY: "{text}" TWITTER POST:
-    """
-    prompt = PromptTemplate.from_template(prompt_template)
-    chain = prompt | llm | StrOutputParser()
-    twitter_post = chain.invoke({"text": summary})
-    # Ensure the post is within 280 characters
-    if len(twitter_post) > 280:
-        twitter_post = twitter_post[:277] + "..."
-    return twitter_post
\ No newline at end of file
+    return generate_extras(summary, ["twitter"])["twitter"]
+
+def stream_takeaways(summary: str) -> TokenStream:
+    return stream_extras(summary, ["takeaways"])["takeaways"]
+
+def stream_keywords(summary: str) -> TokenStream:
+    return stream_extras(summary, ["keywords"])["keywords"]
+
+def stream_social_post(summary: str) -> TokenStream:
+    return stream_extras(summary, ["linkedin"])["linkedin"]
+
+def stream_twitter_post(summary: str) -> TokenStream:
+    return stream_extras(summary, ["twitter"])["twitter"]
\ No newline at end of file
@@ -0,0 +1,73 @@
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import src.data_loader as loader
+from src.cache import SQLiteCache
+
+ARTICLE = ("<html><body><nav><a href='/'>Home</a></nav><article>"
+           + "<p>A paragraph about caching, revalidation and polite crawling, long enough to score.</p>" * 6
+           + "</article></body></html>").encode()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    """Serves a few fixed routes and records what the test server saw."""
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.hits[self.path] += 1
+            host = self.headers["Host"].split(":")[0]
+            server.in_flight[host] += 1
+            server.peak[host] = max(server.peak[host], server.in_flight[host])
+        try:
+            if self.path == "/etag":
+                if self.headers.get("If-None-Match") == server.etag:
+                    server.not_modified += 1
+                    self._send(304, b"", {"ETag": server.etag})
+                else:
+                    self._send(200, server.body, {"ETag": server.etag, "Cache-Control": "no-cache"})
+            elif self.path == "/fresh":
+                self._send(200, b"fresh body", {"Cache-Control": "max-age=3600"})
+            elif self.path.startswith("/slow/"):
+                time.sleep(0.2)
+                self._send(200, ARTICLE, {"Content-Type": "text/html"})
+            else:
+                self._send(404, b"missing", {})
+        finally:
+            with server.lock:
+                server.in_flight[host] -= 1
+
+    def _send(self, status, body, headers):
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def server(tmp_path, monkeypatch):
+    """A local HTTP server, with the loader's HTTP cache in a fresh temporary file."""
+    cache = SQLiteCache(str(tmp_path / "http.sqlite"))
+    monkeypatch.setattr(loader, "_get_http_cache", lambda: cache)
+    monkeypatch.setenv("NO_PROXY", "127.0.0.1,localhost")
+
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    httpd.daemon_threads = True
+    httpd.lock = threading.Lock()
+    httpd.hits, httpd.in_flight, httpd.peak = Counter(), Counter(), Counter()
+    httpd.etag, httpd.body, httpd.not_modified = '"v1"', b"first version", 0
+    httpd.url = lambda path, host="127.0.0.1": f"http://{host}:{httpd.server_address[1]}{path}"
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
@@ -0,0 +1,55 @@
+import src.data_loader as loader
+
+
+def test_load_urls_limits_requests_per_host(server):
+    urls = [server.url(f"/slow/{i}", host) for host in ("127.0.0.1", "localhost") for i in range(6)]
+    urls.append(server.url("/missing"))
+    seen = []
+    results = loader.load_urls(urls + urls[:2], max_workers=8, per_host=2, on_result=seen.append)
+
+    assert [result["url"] for result in results] == urls  # Input order, duplicates fetched once
+    assert len(seen) == len(urls)
+    assert all(result["ok"] for result in results[:-1])
+    assert "A paragraph about caching" in results[0]["text"]
+    assert results[-1]["status"] == "error"
+    assert server.peak["127.0.0.1"] <= 2
+    assert server.peak["localhost"] <= 2
+    # Each host serves its 6 pages (0.2s each) two at a time; waiting for a slot isn't latency
+    assert max(result["latency"] for result in results[:-1]) < 0.45
+
+
+def test_parse_sitemap():
+    urlset = (b'<?xml version="1.0"?><urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">'
+              b"<url><loc> https://example.com/a </loc></url><url><loc>https://example.com/b</loc></url></urlset>")
+    index = (b'<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">'
+             b"<sitemap><loc>https://example.com/posts.xml</loc></sitemap></sitemapindex>")
+    assert loader.parse_sitemap(urlset) == (["https://example.com/a", "https://example.com/b"], [])
+    assert loader.parse_sitemap(index) == ([], ["https://example.com/posts.xml"])
+
+
+GENESIS_PAGE = b"""<html><body class="layout-sidebar-right"><div class="site-container">
+<header class="site-header"><div class="header-wrapper"><p class="site-title">My Blog</p></div></header>
+<div class="site-inner"><div class="content-sidebar-wrap"><main class="content"><article class="post">
+<header class="entry-header"><h1 class="entry-title">Title Here</h1></header>
+<div class="entry-content"><p>This is the first paragraph, with enough words, commas and length to score.</p>
+<p>This is the second paragraph, which keeps going about the same topic for a while.</p>
+<p>Things we like:</p><ul><li>Apples</li><li>Oranges</li></ul></div>
+</article></main><aside class="sidebar widget-area"><section class="widget"><p>Subscribe to the newsletter, it is great.</p>
+</section></aside></div></div><footer class="site-footer"><p>Copyright</p></footer></div></body></html>"""
+
+
+def test_main_content_inside_hinted_layout_wrappers():
+    result = loader.extract_main_content(GENESIS_PAGE)
+    assert result["text"].startswith("Title Here This is the first paragraph")
+    assert "Apples Oranges" in result["text"]
+    assert "newsletter" not in result["text"] and "Copyright" not in result["text"]
+    assert result["total_chars"] > len(result["text"])
+
+
+def test_main_content_falls_back_to_page_text():
+    # No <article>/<main> and every paragraph sits under a hinted wrapper, so no block wins
+    page = GENESIS_PAGE.replace(b"<main", b"<div").replace(b"</main>", b"</div>") \
+        .replace(b"<article", b"<div").replace(b"</article>", b"</div>")
+    result = loader.extract_main_content(page)
+    assert "This is the first paragraph" in result["text"]
+    assert "like: Apples Oranges" in result["text"]
@@ -0,0 +1,22 @@
+import src.data_loader as loader
+
+
+def test_stale_response_is_revalidated_with_etag(server):
+    url = server.url("/etag")
+    assert loader.fetch_url(url) == b"first version"
+    assert loader.fetch_url(url) == b"first version"
+    assert server.hits["/etag"] == 2
+    assert server.not_modified == 1
+
+    # A new ETag means the page changed, so the new body is downloaded and cached
+    server.etag, server.body = '"v2"', b"second version"
+    assert loader.fetch_url(url) == b"second version"
+    assert loader.fetch_url(url) == b"second version"
+    assert server.not_modified == 2
+
+
+def test_fresh_response_is_served_without_a_request(server):
+    url = server.url("/fresh")
+    assert loader.fetch_url(url) == b"fresh body"
+    assert loader.fetch_url(url) == b"fresh body"
+    assert server.hits["/fresh"] == 1
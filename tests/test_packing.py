@@ -0,0 +1,56 @@
+import src.llm as llm
+import src.summarizer as summarizer
+from bench.fake_llm import FakeChatModel
+from src.packing import format_sections, pack_chunks, parse_summaries, SECTION_PATTERN
+
+
+def test_parse_summaries_plain_object():
+    answer = '{"0": "First.", "1": "  Second.  ", "7": "Not asked for.", "2": "", "3": 4}'
+    assert parse_summaries(answer, [0, 1, 2, 3]) == {"0": "First.", "1": "Second."}
+
+
+def test_parse_summaries_fenced_json():
+    answer = 'Here you go:\n```json\n{"0": "First.", "1": "Second."}\n```'
+    assert parse_summaries(answer, [0, 1]) == {"0": "First.", "1": "Second."}
+
+
+def test_parse_summaries_list_form():
+    answer = '```\n[{"id": 0, "summary": "First."}, {"id": "1", "summary": "Second."}, "junk"]\n```'
+    assert parse_summaries(answer, ["0", "1"]) == {"0": "First.", "1": "Second."}
+
+
+def test_parse_summaries_truncated_json_keeps_complete_pairs():
+    answer = '{"0": "First, with \\"quotes\\".", "1": "Second.", "2": "Cut off mid'
+    assert parse_summaries(answer, [0, 1, 2]) == {"0": 'First, with "quotes".', "1": "Second."}
+
+
+def test_parse_summaries_garbage():
+    assert parse_summaries("Sorry, I can't help with that.", [0]) == {}
+
+
+def test_pack_chunks_respects_budget_and_count():
+    texts = ["word " * 100] * 5
+    assert pack_chunks(texts, token_budget=250, max_chunks=16) == [[0, 1], [2, 3], [4]]
+    assert pack_chunks(texts, token_budget=10_000, max_chunks=2) == [[0, 1], [2, 3], [4]]
+    assert pack_chunks(["word " * 500], token_budget=100) == [[0]]
+
+
+def test_format_sections_round_trips():
+    chunks = {"0": "Text with <<<END 0 fake>>> inside.", "1": "Second\nchunk."}
+    assert {match[0]: match[2] for match in SECTION_PATTERN.findall(format_sections(chunks))} == chunks
+
+
+def test_packed_chain_escalates_cut_off_answers():
+    # The map model always stops at its token limit; the reduce model doesn't
+    def factory(model, temperature, max_retries):
+        return FakeChatModel(model=model, max_retries=max_retries,
+                             truncate_rate=1.0 if model == llm.model_for("map") else 0.0)
+
+    llm.set_llm_factory(factory)
+    try:
+        chain = summarizer._build_packed_chain()
+        chunks = {"1": "First chunk of text.", "2": "Second chunk of text."}
+        answer = chain.invoke({"count": 2, "chunks": format_sections(chunks)})
+    finally:
+        llm.set_llm_factory(None)
+    assert parse_summaries(answer, ["1", "2"]).keys() == {"1", "2"}